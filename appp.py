@@ -1,8 +1,28 @@
+import copy
+import hashlib
+import heapq
+import importlib.util
+import itertools
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
 import matplotlib.pyplot as plt
-from scipy.stats import pearsonr, spearmanr, shapiro, linregress
+from scipy.stats import pearsonr, spearmanr, shapiro, linregress, rankdata
+from scipy.stats import chi2, t as student_t
 
 # =====================
 # Page Config (Light mode)
@@ -27,7 +47,7 @@ LANG = {
     "id": {
         "title": "📊 Aplikasi Analisis Data Survei",
         "desc": "Analisis deskriptif dan asosiasi (korelasi). Uji normalitas digunakan untuk memilih Pearson atau Spearman.",
-        "upload": "Upload file dataset (CSV atau Excel .xlsx)",
+        "upload": "Upload file dataset (CSV, Excel .xlsx, Parquet, Feather/Arrow)",
         "preview": "Pratinjau Data",
         "desc_stat": "Analisis Deskriptif (Numerik)",
         "select_numeric": "Pilih kolom numerik (untuk statistik deskriptif)",
@@ -39,7 +59,7 @@ LANG = {
         "method": "Metode Korelasi",
         "corr": "Koefisien Korelasi",
         "pval": "p-value",
-        "normality": "Uji Normalitas (Shapiro-Wilk)",
+        "normality": "Uji Normalitas",
         "px": "p-value X",
         "py": "p-value Y",
         "info": "Silakan upload file untuk memulai.",
@@ -47,6 +67,85 @@ LANG = {
         "convert_hint": "Coba konversi kolom bertipe teks ke numerik (opsional).",
         "convert_cols": "Pilih kolom yang ingin dicoba dikonversi ke numerik",
         "apply_convert": "Terapkan konversi",
+        "converted": "Kolom yang sudah dikonversi",
+        "streaming": "Mode streaming untuk CSV besar",
+        "streaming_help": "Membaca CSV per bagian (chunk) sehingga memori tetap terbatas berapa pun ukuran file.",
+        "stream_note": "Mode streaming: statistik dihitung dalam satu lintasan; kuartil eksak tidak tersedia.",
+        "append_wave": "Tambah gelombang data (respons baru, opsional)",
+        "append_wave_help": "File berisi baris baru dengan kolom yang sama. Momen, sketch kuantil, dan jumlah cross-product korelasi diperbarui hanya dengan baris baru.",
+        "wave_missing": "kolom tidak ada (diisi kosong)",
+        "wave_rows": "{waves} gelombang ditambahkan ({rows} baris baru).",
+        "weight_col": "Kolom bobot survei",
+        "no_weight": "(tanpa bobot)",
+        "weighted": "berbobot",
+        "weighted_note": "Berbobot menurut '{col}': rata-rata, std, dan kuartil memakai bobot survei (kuartil: aturan titik tengah); baris dengan bobot kosong atau ≤ 0 dikeluarkan. p-value memakai n efektif Kish.",
+        "weights_pair_only": "Bobot survei diterapkan pada tabel deskriptif dan analisis pasangan; mode ini tidak berbobot.",
+        "permutation": "p-value permutasi (sampel kecil / banyak ties)",
+        "permutation_help": "Satu kolom diacak berulang kali; p-value tidak bergantung pada asumsi distribusi.",
+        "perm_precision": "Presisi p-value (±)",
+        "perm_p": "p-value permutasi",
+        "perm_exact": "Eksak: semua {permutations} urutan dihitung.",
+        "perm_note": "{permutations} permutasi acak; p-value ±{half_width:.4f} (95%).",
+        "covariates": "Kontrol untuk kovariat (korelasi parsial, opsional)",
+        "partial": "Korelasi parsial",
+        "partial_note": "Dikontrol untuk: {covariates}. Dihitung dari matriks korelasi pairwise-complete (tanpa bobot).",
+        "correction": "Koreksi uji berganda",
+        "correction_bh": "Benjamini-Hochberg (FDR)",
+        "correction_holm": "Holm (FWER)",
+        "q_threshold": "Tampilkan pasangan dengan p terkoreksi ≤",
+        "topk_adjust_note": "Koreksi memakai jumlah seluruh pasangan yang diuji; untuk K pasangan yang ditampilkan, q BH bersifat konservatif.",
+        "method_auto": "Otomatis (aturan normalitas)",
+        "include_kendall": "Sertakan Kendall tau-b",
+        "kendall_note": "Kendall tau-b dihitung tanpa bobot; p-value permutasi, IK bootstrap, dan korelasi per segmen tersedia untuk Pearson/Spearman.",
+        "bootstrap": "Interval kepercayaan bootstrap 95%",
+        "bootstrap_help": "Resampling baris dengan pengembalian; Spearman dihitung ulang per resample tanpa mengurutkan ulang.",
+        "resamples": "Jumlah resample",
+        "ci": "IK 95% (bootstrap)",
+        "ci_note": "Interval persentil dari {resamples} resample bootstrap.",
+        "split_by": "Pisahkan menurut (kolom kategori)",
+        "group_corr_by": "Korelasi per segmen menurut (opsional)",
+        "group_corr": "Korelasi per segmen",
+        "no_split": "(tanpa pemisahan)",
+        "segment": "Segmen",
+        "all_segments": "(semua segmen)",
+        "too_many_groups": "Kolom {col} memiliki lebih dari {limit} nilai berbeda pada data lengkap; tidak dipakai untuk pemisahan.",
+        "desc_engine": "Mesin statistik deskriptif",
+        "desc_engine_exact": "Lengkap (pandas describe)",
+        "desc_engine_parallel": "Lengkap, paralel (semua core CPU)",
+        "desc_engine_moments": "Satu lintasan (momen: + skewness, kurtosis)",
+        "sketch": "Kuartil aproksimasi (sketch kuantil)",
+        "sketch_help": "Sketch KLL dibangun saat data dibaca dan dapat digabung antar-chunk; tanpa pengurutan penuh.",
+        "sketch_accuracy": "Akurasi sketch (galat peringkat, %)",
+        "sketch_note": "Kolom bertanda ≈ adalah kuartil aproksimasi (sketch KLL, galat peringkat sekitar ±{accuracy}%). Pilih mesin 'Lengkap' untuk kuartil eksak.",
+        "csv_engine": "Parser CSV",
+        "engine_pandas": "pandas (standar)",
+        "engine_arrow": "Arrow (multithread + downcast tipe)",
+        "memory": "Memori data (sebelum → sesudah downcast)",
+        "sheet": "Pilih sheet",
+        "excel_parquet": "Simpan sheet Excel sebagai Parquet (konversi sekali)",
+        "excel_parquet_help": "Sheet dikonversi sekali ke file kolumnar; rerun berikutnya tidak membaca XLSX lagi.",
+        "columns": "Daftar kolom",
+        "parsing": "Membaca seluruh file… analisis akan muncul setelah selesai.",
+        "assoc_mode": "Mode analisis asosiasi",
+        "mode_pair": "Satu pasangan (X vs Y)",
+        "mode_matrix": "Semua pasangan (matriks korelasi)",
+        "matrix_cols": "Pilih kolom untuk matriks korelasi",
+        "run_matrix": "Hitung Matriks Korelasi",
+        "pairwise_note": "Missing value ditangani per pasangan (pairwise-complete); n = jumlah baris valid tiap pasangan.",
+        "heatmap": "Heatmap Korelasi",
+        "error_matrix": "Pilih minimal 2 kolom.",
+        "normality_screen": "Tampilkan uji normalitas untuk kolom yang dipilih",
+        "normal_p": "p normalitas",
+        "normal_test": "Uji yang digunakan",
+        "large_n": "Uji normalitas untuk sampel besar (n > 5.000)",
+        "large_n_subsample": "Shapiro-Wilk pada subsampel bertingkat (5.000 baris)",
+        "large_n_dagostino": "D'Agostino K² (semua baris, dari momen)",
+        "large_n_shapiro": "Shapiro-Wilk penuh (lambat)",
+        "large_n_help": "Shapiro-Wilk menjadi lambat dan kurang akurat di atas 5.000 observasi.",
+        "mode_topk": "K asosiasi terkuat",
+        "top_k": "Jumlah pasangan (K)",
+        "run_topk": "Cari Asosiasi Terkuat",
+        "topk_note": "Metode tiap pasangan mengikuti aturan normalitas (uji per kolom): Pearson jika keduanya normal, selain itu Spearman.",
         "error_pairs": "Data valid tidak cukup untuk analisis (minimal 3 baris setelah hapus missing).",
         "positive": "positif",
         "negative": "negatif",
@@ -59,7 +158,7 @@ LANG = {
     "en": {
         "title": "📊 Survey Data Analysis App",
         "desc": "Descriptive and association analysis (correlation). Normality testing helps choose Pearson or Spearman.",
-        "upload": "Upload dataset file (CSV or Excel .xlsx)",
+        "upload": "Upload dataset file (CSV, Excel .xlsx, Parquet, Feather/Arrow)",
         "preview": "Data Preview",
         "desc_stat": "Descriptive Analysis (Numeric)",
         "select_numeric": "Select numeric columns (for descriptive statistics)",
@@ -71,7 +170,7 @@ LANG = {
         "method": "Correlation Method",
         "corr": "Correlation Coefficient",
         "pval": "p-value",
-        "normality": "Normality Test (Shapiro-Wilk)",
+        "normality": "Normality Test",
         "px": "p-value X",
         "py": "p-value Y",
         "info": "Please upload a file to start.",
@@ -79,6 +178,85 @@ LANG = {
         "convert_hint": "Try converting text columns to numeric (optional).",
         "convert_cols": "Select columns to attempt numeric conversion",
         "apply_convert": "Apply conversion",
+        "converted": "Converted columns",
+        "streaming": "Streaming mode for large CSV",
+        "streaming_help": "Reads the CSV in chunks so memory stays bounded regardless of file size.",
+        "stream_note": "Streaming mode: statistics are computed in a single pass; exact quartiles are not available.",
+        "append_wave": "Append wave (new responses, optional)",
+        "append_wave_help": "Files with new rows and the same columns. Moments, quantile sketches and correlation cross-product sums are updated with the new rows only.",
+        "wave_missing": "missing columns (left empty)",
+        "wave_rows": "{waves} wave(s) appended ({rows} new rows).",
+        "weight_col": "Survey weight column",
+        "no_weight": "(unweighted)",
+        "weighted": "weighted",
+        "weighted_note": "Weighted by '{col}': mean, std and quartiles use the survey weights (quartiles: midpoint rule); rows with a missing or ≤ 0 weight are excluded. p-values use the Kish effective n.",
+        "weights_pair_only": "Survey weights apply to the descriptive table and the pair analysis; this mode is unweighted.",
+        "permutation": "Permutation p-value (small / heavily tied samples)",
+        "permutation_help": "One column is shuffled repeatedly; the p-value does not rely on distributional assumptions.",
+        "perm_precision": "p-value precision (±)",
+        "perm_p": "Permutation p-value",
+        "perm_exact": "Exact: all {permutations} orderings evaluated.",
+        "perm_note": "{permutations} random permutations; p-value ±{half_width:.4f} (95%).",
+        "covariates": "Control for covariates (partial correlation, optional)",
+        "partial": "Partial correlation",
+        "partial_note": "Controlling for: {covariates}. Computed from the pairwise-complete correlation matrix (unweighted).",
+        "correction": "Multiple-testing correction",
+        "correction_bh": "Benjamini-Hochberg (FDR)",
+        "correction_holm": "Holm (FWER)",
+        "q_threshold": "Show pairs with adjusted p ≤",
+        "topk_adjust_note": "Corrections use the number of all tested pairs; for the K pairs shown the BH q-value is conservative.",
+        "method_auto": "Automatic (normality rule)",
+        "include_kendall": "Include Kendall tau-b",
+        "kendall_note": "Kendall tau-b is unweighted; permutation p-values, bootstrap CIs and per-segment correlations are available for Pearson/Spearman.",
+        "bootstrap": "95% bootstrap confidence interval",
+        "bootstrap_help": "Rows are resampled with replacement; Spearman is recomputed per resample without re-sorting.",
+        "resamples": "Resamples",
+        "ci": "95% CI (bootstrap)",
+        "ci_note": "Percentile interval from {resamples} bootstrap resamples.",
+        "split_by": "Split by (categorical column)",
+        "group_corr_by": "Correlation per segment by (optional)",
+        "group_corr": "Correlation per segment",
+        "no_split": "(no split)",
+        "segment": "Segment",
+        "all_segments": "(all segments)",
+        "too_many_groups": "{col} has more than {limit} distinct values in the full data; not used for splitting.",
+        "desc_engine": "Descriptive statistics engine",
+        "desc_engine_exact": "Full (pandas describe)",
+        "desc_engine_parallel": "Full, parallel (all CPU cores)",
+        "desc_engine_moments": "Single pass (moments: + skewness, kurtosis)",
+        "sketch": "Approximate quartiles (quantile sketch)",
+        "sketch_help": "KLL sketches are built while the data is read and merge across chunks; no full sorts.",
+        "sketch_accuracy": "Sketch accuracy (rank error, %)",
+        "sketch_note": "Columns marked ≈ are approximate quartiles (KLL sketch, rank error about ±{accuracy}%). Choose the 'Full' engine for exact quartiles.",
+        "csv_engine": "CSV parser",
+        "engine_pandas": "pandas (default)",
+        "engine_arrow": "Arrow (multithreaded + dtype downcast)",
+        "memory": "Data memory (before → after downcast)",
+        "sheet": "Select sheet",
+        "excel_parquet": "Cache Excel sheet as Parquet (one-time conversion)",
+        "excel_parquet_help": "The sheet is converted once to a columnar file; later reruns never read the XLSX again.",
+        "columns": "Column list",
+        "parsing": "Parsing the full file… analysis sections appear when it finishes.",
+        "assoc_mode": "Association analysis mode",
+        "mode_pair": "Single pair (X vs Y)",
+        "mode_matrix": "All pairs (correlation matrix)",
+        "matrix_cols": "Select columns for the correlation matrix",
+        "run_matrix": "Compute Correlation Matrix",
+        "pairwise_note": "Missing values are handled pairwise-complete; n = valid rows for each pair.",
+        "heatmap": "Correlation Heatmap",
+        "error_matrix": "Select at least 2 columns.",
+        "normality_screen": "Show normality screening for the selected columns",
+        "normal_p": "Normality p",
+        "normal_test": "Test used",
+        "large_n": "Normality test for large samples (n > 5,000)",
+        "large_n_subsample": "Shapiro-Wilk on a stratified subsample (5,000 rows)",
+        "large_n_dagostino": "D'Agostino K² (all rows, from moments)",
+        "large_n_shapiro": "Full Shapiro-Wilk (slow)",
+        "large_n_help": "Shapiro-Wilk gets slow and inaccurate above 5,000 observations.",
+        "mode_topk": "K strongest associations",
+        "top_k": "Number of pairs (K)",
+        "run_topk": "Find Strongest Associations",
+        "topk_note": "Each pair's method follows the normality rule (tested per column): Pearson if both are normal, otherwise Spearman.",
         "error_pairs": "Not enough valid data (need at least 3 rows after dropping missing).",
         "positive": "positive",
         "negative": "negative",
@@ -110,31 +288,1770 @@ st.write(T["desc"])
 # =====================
 # Upload File
 # =====================
-uploaded_file = st.file_uploader(T["upload"], type=["xlsx", "csv"])
+UPLOAD_TYPES = ["xlsx", "csv", "parquet", "feather", "arrow", "ipc"]
+uploaded_file = st.file_uploader(T["upload"], type=UPLOAD_TYPES)
+stream_mode = st.sidebar.checkbox(T["streaming"], help=T["streaming_help"])
+csv_engine = st.sidebar.selectbox(
+    T["csv_engine"],
+    ["pandas", "pyarrow"],
+    format_func=lambda x: T["engine_pandas"] if x == "pandas" else T["engine_arrow"],
+)
+excel_to_parquet = st.sidebar.checkbox(T["excel_parquet"], help=T["excel_parquet_help"])
+normality_mode = st.sidebar.selectbox(
+    T["large_n"],
+    ["subsample", "dagostino", "shapiro"],
+    format_func=lambda x: T[f"large_n_{x}"],
+    help=T["large_n_help"],
+)
 
-def read_data(file):
+# calamine (Rust) is far faster than openpyxl; fall back when it isn't installed.
+EXCEL_ENGINE = "calamine" if importlib.util.find_spec("python_calamine") else None
+
+def read_data(file, engine="pandas", sheet=0):
     name = file.name.lower()
+    if is_columnar(file):
+        return columnar_table(file).to_pandas()
     if name.endswith(".csv"):
+        if engine == "pyarrow":
+            # Multithreaded Arrow CSV reader, then lossless numeric downcast.
+            df = pd.read_csv(file, engine="pyarrow")
+            parsed_bytes = nbytes(df)
+            df = downcast_frame(df)
+            df.attrs["parsed_bytes"] = parsed_bytes
+            return df
         return pd.read_csv(file)
-    return pd.read_excel(file)
+    return pd.read_excel(file, sheet_name=sheet, engine=EXCEL_ENGINE)
+
+# =====================
+# Shared Cache
+# =====================
+# Every widget interaction reruns this script, so parsed uploads are cached by
+# content hash and shared across sessions. Budget is configurable (MB).
+CACHE_BUDGET_MB = int(os.environ.get("SURVEY_CACHE_MB", "1024"))
+
+
+def nbytes(obj):
+    """Approximate memory footprint of a cached value in bytes."""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sum(nbytes(v) for v in obj.values()) + sys.getsizeof(obj)
+    if isinstance(obj, (list, tuple)):
+        return sum(nbytes(v) for v in obj) + sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):  # accumulators (moments, sketches, sums)
+        return nbytes(vars(obj)) + sys.getsizeof(obj)
+    return sys.getsizeof(obj)
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by a memory budget in bytes."""
+
+    def __init__(self, budget_bytes):
+        self.budget = budget_bytes
+        self.used = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, value):
+        size = nbytes(value)
+        with self._lock:
+            if key in self._items:
+                self.used -= self._items.pop(key)[1]
+            # Values larger than the whole budget are returned but not kept.
+            if size <= self.budget:
+                self._items[key] = (value, size)
+                self.used += size
+                while self.used > self.budget:
+                    _, (_, old_size) = self._items.popitem(last=False)
+                    self.used -= old_size
+        return value
+
+
+@st.cache_resource
+def get_cache():
+    # cache_resource: one instance per server process, shared by all sessions.
+    return LRUCache(CACHE_BUDGET_MB * 1024 * 1024)
+
+
+def file_digest(file):
+    """Content hash of an upload, memoized per upload so reruns don't re-hash."""
+    if isinstance(file, ColumnarCopy):
+        return file.digest
+    digests = st.session_state.setdefault("file_digests", {})
+    upload_id = getattr(file, "file_id", None) or (file.name, file.size)
+    if upload_id not in digests:
+        digests[upload_id] = hashlib.sha256(file.getvalue()).hexdigest()
+    return digests[upload_id]
+
+
+def load_data(file, engine="pandas", sheet=0):
+    """Parse an upload once; later reruns (and other sessions) reuse the frame."""
+    cache = get_cache()
+    key = ("frame", file_digest(file), engine, sheet)
+    df = cache.get(key)
+    if df is None:
+        df = cache.put(key, read_data(file, engine, sheet))
+    return df
+
+
+def apply_conversions(df, source_key, plan):
+    """Derived frame with the `plan` columns coerced to numeric, cached on (source, plan)."""
+    if not plan:
+        return df
+    cache = get_cache()
+    key = ("converted", source_key, plan)
+    out = cache.get(key)
+    if out is None:
+        # Shallow copy: only the converted columns get new buffers.
+        out = df.copy(deep=False)
+        for c in plan:
+            out[c] = pd.to_numeric(out[c], errors="coerce")
+        out = cache.put(key, out)
+    return out
+
+
+def is_text_column(s):
+    return pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s)
+
+# =====================
+# Streaming Ingestion (CSV)
+# =====================
+# For files too large to hold as a DataFrame: only a sample is parsed up front,
+# column statistics are folded chunk by chunk, and just the columns that are
+# actually analysed are kept (as compact numeric arrays).
+CHUNK_ROWS = 100_000
+SNIFF_ROWS = 1_000
+
+
+def open_upload(file):
+    """Independent read handle over the upload bytes (no copy of the buffer)."""
+    return io.BytesIO(file.getvalue())
+
+
+class RunningMoments:
+    """Mergeable per-column count, mean, central moment sums (M2..M4), min, max.
+
+    Blocks are folded with the pairwise update of Chan et al. / Pébay, so
+    partial results from chunks or threads combine exactly, and an appended
+    batch only needs its own rows folded in.
+    """
+
+    def __init__(self, ncols):
+        self.n = np.zeros(ncols)
+        self.mean = np.zeros(ncols)
+        self.m2 = np.zeros(ncols)
+        self.m3 = np.zeros(ncols)
+        self.m4 = np.zeros(ncols)
+        self.min = np.full(ncols, np.inf)
+        self.max = np.full(ncols, -np.inf)
+
+    @classmethod
+    def from_block(cls, x):
+        x = np.asarray(x, dtype=np.float64)
+        if x.ndim == 1:
+            x = x[:, None]
+        out = cls(x.shape[1])
+        mask = ~np.isnan(x)
+        out.n = mask.sum(axis=0).astype(np.float64)
+        out.mean = np.where(mask, x, 0.0).sum(axis=0) / np.maximum(out.n, 1)
+        dev = np.where(mask, x - out.mean, 0.0)
+        dev2 = dev ** 2
+        out.m2 = dev2.sum(axis=0)
+        out.m3 = (dev2 * dev).sum(axis=0)
+        out.m4 = (dev2 ** 2).sum(axis=0)
+        out.min = np.where(mask, x, np.inf).min(axis=0)
+        out.max = np.where(mask, x, -np.inf).max(axis=0)
+        return out
+
+    def merge(self, other):
+        na, nb = self.n, other.n
+        n = na + nb
+        safe_n = np.maximum(n, 1)
+        delta = other.mean - self.mean
+        d_n = delta / safe_n
+        m2 = self.m2 + other.m2 + delta * d_n * na * nb
+        m3 = (
+            self.m3 + other.m3
+            + delta * d_n ** 2 * na * nb * (na - nb)
+            + 3 * d_n * (na * other.m2 - nb * self.m2)
+        )
+        m4 = (
+            self.m4 + other.m4
+            + delta * d_n ** 3 * na * nb * (na * na - na * nb + nb * nb)
+            + 6 * d_n ** 2 * (na * na * other.m2 + nb * nb * self.m2)
+            + 4 * d_n * (na * other.m3 - nb * self.m3)
+        )
+        self.mean = self.mean + d_n * nb
+        self.n, self.m2, self.m3, self.m4 = n, m2, m3, m4
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        return self
+
+    def update(self, x):
+        return self.merge(RunningMoments.from_block(x))
+
+    def normality_p(self):
+        """D'Agostino K² p-value per column straight from the moments."""
+        n = np.maximum(self.n, 1)
+        return dagostino_k2(self.n, self.m2 / n, self.m3 / n, self.m4 / n)
+
+    def to_frame(self, columns):
+        """describe()-style table (one row per column), plus skewness and
+        excess kurtosis with the same bias corrections as pandas skew()/kurt()."""
+        n = self.n
+        seen = n > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(self.m2 / (n - 1))
+            g1 = np.sqrt(n) * self.m3 / self.m2 ** 1.5
+            skew = g1 * np.sqrt(n * (n - 1)) / (n - 2)
+            g2 = n * self.m4 / self.m2 ** 2 - 3
+            kurt = ((n + 1) * g2 + 6) * (n - 1) / ((n - 2) * (n - 3))
+        constant = self.m2 <= 1e-14 * np.maximum(self.mean ** 2, 1.0) * n
+        return pd.DataFrame(
+            {
+                "count": n,
+                "mean": np.where(seen, self.mean, np.nan),
+                "std": np.where(n > 1, std, np.nan),
+                "min": np.where(seen, self.min, np.nan),
+                "max": np.where(seen, self.max, np.nan),
+                "skew": np.where(n > 2, np.where(constant, 0.0, skew), np.nan),
+                "kurt": np.where(n > 3, np.where(constant, 0.0, kurt), np.nan),
+            },
+            index=pd.Index(columns),
+        )
+
+
+class KLLSketch:
+    """Mergeable KLL quantile sketch (Karnin, Lang & Liberty) for one column.
+
+    Level h holds items of weight 2**h; an over-full level is sorted and every
+    other item (random offset) is promoted. Capacities shrink by 2/3 per level
+    below the top, so space is O(k) and the rank error roughly 2 / k.
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, h):
+        return max(2, int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - h - 1))))
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            if len(self.levels[h]) > self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(self.levels[h])
+                # An odd item out stays at this level.
+                keep, items = items[len(items) - len(items) % 2:], items[: len(items) - len(items) % 2]
+                promoted = items[self._rng.integers(2)::2]
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantiles(self, qs):
+        if self.n == 0:
+            return np.full(len(qs), np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(lv), 2.0 ** h) for h, lv in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        items, cum = items[order], np.cumsum(weights[order])
+        idx = np.searchsorted(cum, np.asarray(qs) * cum[-1], side="left")
+        return items[np.minimum(idx, len(items) - 1)]
+
+
+class QuantileSketches:
+    """One KLLSketch per column, fed with row blocks like RunningMoments."""
+
+    def __init__(self, ncols, k):
+        self.sketches = [KLLSketch(k) for _ in range(ncols)]
+
+    def update(self, x):
+        for j, sketch in enumerate(self.sketches):
+            sketch.update(x[:, j])
+        return self
+
+    def merge(self, other):
+        for mine, theirs in zip(self.sketches, other.sketches):
+            mine.merge(theirs)
+        return self
+
+    def quantiles(self, qs):
+        return np.array([s.quantiles(qs) for s in self.sketches]).reshape(len(self.sketches), len(qs))
+
+
+def parallel_describe(frame):
+    """describe().T of numeric columns with the columns split across the worker pool.
+
+    The columns are copied once into a Fortran-ordered float64 buffer that all
+    workers read in place (threads: nothing is pickled, no DataFrame crosses a
+    boundary); numpy releases the GIL in the per-column reductions/partitions.
+    """
+    cols = list(frame.columns)
+    buf = np.asfortranarray(numeric_matrix(frame))
+
+    def describe_columns(idx):
+        out = np.full((len(idx), 8), np.nan)
+        for row, j in enumerate(idx):
+            v = buf[:, j]
+            v = v[~np.isnan(v)]
+            out[row, 0] = len(v)
+            if len(v):
+                out[row, 1] = v.mean()
+                out[row, 2] = v.std(ddof=1) if len(v) > 1 else np.nan
+                # Linear interpolation, as pandas' describe().
+                out[row, 3:] = np.quantile(v, [0, 0.25, 0.5, 0.75, 1])
+        return out
+
+    # A few column groups per core keeps the workers evenly loaded.
+    groups = np.array_split(np.arange(len(cols)), min(len(cols), 4 * (os.cpu_count() or 1))) if cols else []
+    parts = list(get_worker_pool().map(describe_columns, groups))
+    values = np.vstack(parts) if parts else np.empty((0, 8))
+    return pd.DataFrame(values, index=cols, columns=["count", "mean", "std", "min", "25%", "50%", "75%", "max"])
+
+
+def summarize_blocks(blocks, ncols, sketch_k=None):
+    """Fold row blocks into RunningMoments, plus KLL sketches when sketch_k is set."""
+    moments = RunningMoments(ncols)
+    sketches = QuantileSketches(ncols, sketch_k) if sketch_k else None
+    rows = 0
+    for x in blocks:
+        rows += len(x)
+        moments.update(x)
+        if sketches is not None:
+            sketches.update(x)
+    return {"moments": moments, "sketches": sketches, "rows": rows}
+
+
+def merge_summaries(base, delta):
+    """Fold `delta` into a copy of `base` (cached summaries are never mutated)."""
+    merged = copy.deepcopy(base)
+    merged["moments"].merge(delta["moments"])
+    if merged["sketches"] is not None:
+        merged["sketches"].merge(delta["sketches"])
+    merged["rows"] += delta["rows"]
+    return merged
+
+
+def summary_table(summary, columns):
+    """Moments table; approximate quartiles (marked ≈) when sketches exist."""
+    table = summary["moments"].to_frame(columns)
+    if summary["sketches"] is not None:
+        q = summary["sketches"].quantiles([0.25, 0.5, 0.75])
+        for pos, (label, values) in enumerate(zip(["≈25%", "≈50%", "≈75%"], q.T)):
+            table.insert(4 + pos, label, values)
+    return table
+
+
+def frame_summary(frame, key, sketch_k=None, previous=None):
+    """One pass over `frame` in row chunks (moments + optional sketches); cached.
+
+    `previous` is the cache key of the same summary before the last appended
+    wave; when it is cached only the rows added since are folded in.
+    """
+    cache = get_cache()
+    summary = cache.get(key + (sketch_k,))
+    if summary is None:
+        base = cache.get(previous + (sketch_k,)) if previous else None
+        start = base["rows"] if base else 0
+        blocks = (
+            numeric_matrix(frame.iloc[i:i + CHUNK_ROWS]) for i in range(start, len(frame), CHUNK_ROWS)
+        )
+        summary = summarize_blocks(blocks, frame.shape[1], sketch_k)
+        if base:
+            summary = merge_summaries(base, summary)
+        summary = cache.put(key + (sketch_k,), summary)
+    return summary
+
+
+def numeric_block(chunk, cols):
+    """Coerce `cols` of a chunk to a float64 matrix (text -> NaN)."""
+    out = np.empty((len(chunk), len(cols)))
+    for j, c in enumerate(cols):
+        out[:, j] = pd.to_numeric(chunk[c], errors="coerce").to_numpy(np.float64, na_value=np.nan)
+    return out
+
+
+def compact_numeric(s):
+    """Smallest numeric dtype that holds the values losslessly (text -> NaN)."""
+    s = pd.to_numeric(s, errors="coerce")
+    if pd.api.types.is_integer_dtype(s):
+        return pd.to_numeric(s, downcast="integer")
+    if pd.api.types.is_float_dtype(s) and s.dtype != np.float32:
+        as32 = s.astype(np.float32)
+        if np.array_equal(as32.to_numpy(np.float64), s.to_numpy(np.float64), equal_nan=True):
+            return as32
+    return s
+
+
+def downcast_frame(df):
+    """Losslessly downcast numeric columns (Likert ints -> int8/int16, floats -> float32)."""
+    out = df.copy(deep=False)
+    for c in out.columns:
+        if pd.api.types.is_numeric_dtype(out[c]) and not pd.api.types.is_bool_dtype(out[c]):
+            out[c] = compact_numeric(out[c])
+    return out
+
+
+def format_bytes(n):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if n < 1024 or unit == "GB":
+            return f"{n:,.1f} {unit}"
+        n /= 1024
+
+
+def sniff_data(file, sheet=0, nrows=SNIFF_ROWS):
+    """Header and first rows only; used for preview, column list and dtypes."""
+    cache = get_cache()
+    key = ("sniff", file_digest(file), sheet, nrows)
+    head = cache.get(key)
+    if head is None:
+        if file.name.lower().endswith(".csv"):
+            head = pd.read_csv(open_upload(file), nrows=nrows)
+        else:
+            head = pd.read_excel(open_upload(file), sheet_name=sheet, nrows=nrows, engine=EXCEL_ENGINE)
+        head = cache.put(key, head)
+    return head
+
+
+def stream_summary(file, cols, sketch_k=None):
+    """One bounded-memory pass over the CSV folding moments (and quantile
+    sketches when sketch_k is set) for `cols`."""
+    cache = get_cache()
+    key = ("stream_summary", file_digest(file), tuple(cols), sketch_k)
+    summary = cache.get(key)
+    if summary is None:
+        chunks = pd.read_csv(open_upload(file), usecols=list(cols), chunksize=CHUNK_ROWS)
+        blocks = (numeric_block(chunk, list(cols)) for chunk in chunks)
+        summary = cache.put(key, summarize_blocks(blocks, len(cols), sketch_k))
+    return summary
+
+
+def stream_columns(file, cols):
+    """Compact columnar store for `cols`, streamed in chunks and cached per column."""
+    cache = get_cache()
+    digest = file_digest(file)
+    store = {c: cache.get(("stream_col", digest, c)) for c in cols}
+    missing = [c for c in cols if store[c] is None]
+    if missing:
+        parts = {c: [] for c in missing}
+        for chunk in pd.read_csv(open_upload(file), usecols=missing, chunksize=CHUNK_ROWS):
+            for c in missing:
+                parts[c].append(compact_numeric(chunk[c]))
+        for c in missing:
+            col = pd.concat(parts[c], ignore_index=True) if parts[c] else pd.Series(dtype=np.float64)
+            store[c] = cache.put(("stream_col", digest, c), compact_numeric(col))
+    return pd.DataFrame({c: store[c] for c in cols})
+
+
+def stream_labels(file, col):
+    """A label column (e.g. region) streamed in chunks as a categorical; cached.
+    stream_columns coerces to numbers, so grouping columns are read here."""
+    cache = get_cache()
+    key = ("stream_labels", file_digest(file), col)
+    labels = cache.get(key)
+    if labels is None:
+        chunks = pd.read_csv(open_upload(file), usecols=[col], dtype={col: "category"}, chunksize=CHUNK_ROWS)
+        parts = [chunk[col] for chunk in chunks]
+        labels = pd.Series(union_categoricals(parts), name=col) if parts else pd.Series(dtype="category", name=col)
+        labels = cache.put(key, labels)
+    return labels
+
+
+# =====================
+# Columnar Formats (Parquet / Feather / Arrow IPC)
+# =====================
+# Read only what each step needs: schema + first batch for the preview, then
+# projected columns for the descriptive table and the association pair.
+COLUMNAR_EXTS = (".parquet", ".feather", ".arrow", ".ipc")
+
+
+def is_columnar(file):
+    return file.name.lower().endswith(COLUMNAR_EXTS)
+
+
+def arrow_source(file):
+    """Zero-copy Arrow reader: memory-mapped for files on disk; for uploads (which
+    already live in memory) a buffer view over the bytes."""
+    if isinstance(file, ColumnarCopy):
+        return pa.memory_map(file.path)
+    return pa.BufferReader(pa.py_buffer(file.getvalue()))
+
+
+def open_parquet(file):
+    return pq.ParquetFile(arrow_source(file))
+
+
+def columnar_table(file, columns=None):
+    """Feather/IPC table of `columns` (all when None); only those are decompressed."""
+    if file.name.lower().endswith(".parquet"):
+        return open_parquet(file).read(columns=columns)
+    try:
+        return feather.read_table(arrow_source(file), columns=columns)  # Feather v2 == IPC file
+    except pa.ArrowInvalid:
+        # IPC streams have no footer to seek by; read through, then project.
+        table = pa.ipc.open_stream(arrow_source(file)).read_all()
+        return table if columns is None else table.select(columns)
+
+
+def ipc_head(file):
+    """First record batch of a Feather/IPC upload as a table."""
+    try:
+        reader = pa.ipc.open_file(arrow_source(file))
+        if reader.num_record_batches == 0:
+            return reader.schema.empty_table()
+        return pa.Table.from_batches([reader.get_batch(0)])
+    except pa.ArrowInvalid:
+        reader = pa.ipc.open_stream(arrow_source(file))
+        try:
+            return pa.Table.from_batches([reader.read_next_batch()])
+        except StopIteration:
+            return reader.schema.empty_table()
+
+
+def columnar_preview(file, nrows=SNIFF_ROWS):
+    """First rows of every column; only the first batch is decoded."""
+    cache = get_cache()
+    key = ("columnar_head", file_digest(file), nrows)
+    head = cache.get(key)
+    if head is None:
+        if file.name.lower().endswith(".parquet"):
+            pf = open_parquet(file)
+            batch = next(pf.iter_batches(batch_size=nrows), None)
+            table = pa.Table.from_batches([batch]) if batch is not None else pf.schema_arrow.empty_table()
+        else:
+            table = ipc_head(file).slice(0, nrows)
+        head = cache.put(key, table.to_pandas())
+    return head
+
+
+def read_columnar(file, cols):
+    """Projected read of `cols`, cached per column."""
+    cache = get_cache()
+    digest = file_digest(file)
+    store = {c: cache.get(("columnar_col", digest, c)) for c in cols}
+    missing = [c for c in cols if store[c] is None]
+    if missing:
+        frame = columnar_table(file, missing).to_pandas()
+        for c in missing:
+            store[c] = cache.put(("columnar_col", digest, c), frame[c])
+    return pd.DataFrame({c: store[c] for c in cols})
+
+
+def read_columns(file, cols, plan=()):
+    """Only `cols` of the upload: Arrow column projection or streamed CSV chunks."""
+    cols = list(dict.fromkeys(cols))
+    if is_columnar(file):
+        frame = read_columnar(file, cols)
+        todo = tuple(c for c in plan if c in cols)
+        return apply_conversions(frame, ("columns", file_digest(file), tuple(cols)), todo)
+    return stream_columns(file, cols)
+
+
+# =====================
+# Excel
+# =====================
+# Workbooks are parsed with calamine, one chosen sheet at a time. Optionally the
+# sheet is converted once to Parquet on disk and then read via the columnar path.
+EXCEL_CACHE_DIR = os.environ.get(
+    "SURVEY_EXCEL_CACHE", os.path.join(tempfile.gettempdir(), "survey_excel_cache")
+)
+
+
+class ColumnarCopy:
+    """A sheet converted to Parquet on disk; accepted wherever an upload is."""
+
+    def __init__(self, path, digest):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.digest = digest
+
+
+def excel_sheets(file):
+    cache = get_cache()
+    key = ("sheets", file_digest(file))
+    sheets = cache.get(key)
+    if sheets is None:
+        sheets = cache.put(key, pd.ExcelFile(open_upload(file), engine=EXCEL_ENGINE).sheet_names)
+    return sheets
+
+
+def sheet_as_parquet(file, sheet):
+    """One-time conversion of a sheet to Parquet; later reruns never touch the XLSX."""
+    digest = file_digest(file)
+    sheet_no = excel_sheets(file).index(sheet)
+    path = os.path.join(EXCEL_CACHE_DIR, f"{digest}-{sheet_no}.parquet")
+    if not os.path.exists(path):
+        os.makedirs(EXCEL_CACHE_DIR, exist_ok=True)
+        df = load_data(file, sheet=sheet)
+        tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        try:
+            df.to_parquet(tmp, index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed text/number columns: store them as text (the conversion tool
+            # can still coerce them to numeric).
+            mixed = [c for c in df.columns if pd.api.types.is_object_dtype(df[c])]
+            df.astype({c: "string" for c in mixed}).to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+    return ColumnarCopy(path, f"{digest}-{sheet_no}")
+
+# =====================
+# Background Parsing
+# =====================
+# Full parses run off the script thread so the preview (from a fast sniff) shows
+# immediately. Jobs are shared per cache key, so a rerun or a second session
+# attaches to the running parse instead of starting another one.
+class TrackedUpload(io.BytesIO):
+    """Upload bytes for a background parse; read position doubles as progress."""
+
+    def __init__(self, file):
+        super().__init__(file.getvalue())
+        self.name = file.name
+        self.total = max(len(self.getbuffer()), 1)
+
+    def progress(self):
+        # Only CSV is read incrementally; Excel engines load the whole buffer first.
+        if not self.name.lower().endswith(".csv"):
+            return None
+        return min(self.tell() / self.total, 1.0)
+
+
+class ParseJob:
+    def __init__(self, pool, file, engine, sheet):
+        self.upload = TrackedUpload(file)
+        self.future = pool.submit(read_data, self.upload, engine, sheet)
+
+    def done(self):
+        return self.future.done()
+
+    def progress(self):
+        return self.upload.progress()
+
+
+@st.cache_resource
+def get_parse_jobs():
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="parse"), {}, threading.Lock()
+
+
+def parse_in_background(file, engine="pandas", sheet=0):
+    """(frame, None) once parsed and cached, else (None, running ParseJob)."""
+    cache = get_cache()
+    key = ("frame", file_digest(file), engine, sheet)
+    df = cache.get(key)
+    if df is not None:
+        return df, None
+    pool, jobs, lock = get_parse_jobs()
+    with lock:
+        job = jobs.get(key)
+        if job is None:
+            job = jobs[key] = ParseJob(pool, file, engine, sheet)
+        if not job.done():
+            return None, job
+        del jobs[key]
+    # Parse errors surface here, as they did with the synchronous read.
+    return cache.put(key, job.future.result()), None
+
+# =====================
+# Normality
+# =====================
+NORMALITY_ALPHA = 0.05
+# scipy's Shapiro gets slow and its p-value approximate above 5,000 rows.
+SHAPIRO_MAX_N = 5_000
+NORMALITY_SEED = 12345
+
+
+def safe_shapiro(x):
+    """Shapiro-Wilk p-value; NaN when too short or constant (Shapiro fails there)."""
+    x = np.asarray(x)
+    if len(x) < 3:
+        return np.nan
+    if np.all(x == x[0]):  # constant
+        return np.nan
+    try:
+        _, p = shapiro(x)
+        return float(p)
+    except Exception:
+        return np.nan
+
+
+@st.cache_resource
+def get_worker_pool():
+    # Threads share the column arrays directly (nothing is pickled); the numeric
+    # kernels release the GIL for their heavy parts.
+    return ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="stats")
+
+
+def row_filter_key(rows):
+    """Stable cache key for a boolean row subset."""
+    return hashlib.blake2b(np.packbits(rows).tobytes(), digest_size=16).hexdigest()
+
+
+def subset_key(subset, own):
+    """Filter key for a column's row subset; "own" when it is just its non-missing rows."""
+    return "own" if np.array_equal(subset, own) else row_filter_key(subset)
+
+
+def stratified_subsample(x, size, seed=NORMALITY_SEED):
+    """Deterministic subsample: one seeded random row from each of `size`
+    equal, consecutive row strata (covers the whole file, e.g. every wave)."""
+    edges = np.linspace(0, len(x), size + 1).astype(np.int64)
+    u = np.random.default_rng(seed).random(size)
+    return x[edges[:-1] + (u * (edges[1:] - edges[:-1])).astype(np.int64)]
+
+
+def dagostino_k2(n, m2, m3, m4):
+    """D'Agostino-Pearson K² p-value from central moments (m_k = mean of d**k).
+
+    Needs only streamed moments, not the data; same formulas as
+    scipy.stats.normaltest (skewtest + kurtosistest). Vectorised over columns.
+    """
+    n, m2, m3, m4 = (np.asarray(v, dtype=np.float64) for v in (n, m2, m3, m4))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Skewness test
+        b1 = m3 / m2 ** 1.5
+        y = b1 * np.sqrt(((n + 1) * (n + 3)) / (6.0 * (n - 2)))
+        beta2 = (3.0 * (n ** 2 + 27 * n - 70) * (n + 1) * (n + 3)) / ((n - 2.0) * (n + 5) * (n + 7) * (n + 9))
+        w2 = -1 + np.sqrt(2 * (beta2 - 1))
+        delta = 1 / np.sqrt(0.5 * np.log(w2))
+        alpha = np.sqrt(2.0 / (w2 - 1))
+        y = np.where(y == 0, 1, y)
+        z_skew = delta * np.log(y / alpha + np.sqrt((y / alpha) ** 2 + 1))
+        # Kurtosis test
+        b2 = m4 / m2 ** 2
+        mean_b2 = 3.0 * (n - 1) / (n + 1)
+        var_b2 = 24.0 * n * (n - 2) * (n - 3) / ((n + 1) * (n + 1.0) * (n + 3) * (n + 5))
+        xk = (b2 - mean_b2) / np.sqrt(var_b2)
+        sqrt_beta1 = 6.0 * (n * n - 5 * n + 2) / ((n + 7) * (n + 9)) * np.sqrt(
+            (6.0 * (n + 3) * (n + 5)) / (n * (n - 2) * (n - 3))
+        )
+        a = 6.0 + 8.0 / sqrt_beta1 * (2.0 / sqrt_beta1 + np.sqrt(1 + 4.0 / sqrt_beta1 ** 2))
+        term1 = 1 - 2 / (9.0 * a)
+        denom = 1 + xk * np.sqrt(2 / (a - 4.0))
+        term2 = np.sign(denom) * np.where(denom == 0, np.nan, ((1 - 2.0 / a) / np.abs(denom)) ** (1 / 3.0))
+        z_kurt = (term1 - term2) / np.sqrt(2 / (9.0 * a))
+        p = chi2.sf(z_skew ** 2 + z_kurt ** 2, 2)
+    return np.where((n >= 20) & (m2 > 0), p, np.nan)
+
+
+def normality_test(x, mode="subsample"):
+    """(p-value, test name, rows used) for the non-missing values x.
+
+    Up to SHAPIRO_MAX_N rows (or mode "shapiro") this is plain Shapiro-Wilk.
+    Larger samples use Shapiro on a deterministic stratified subsample, or
+    D'Agostino K² over all rows (mode "dagostino").
+    """
+    n = len(x)
+    if n <= SHAPIRO_MAX_N or mode == "shapiro":
+        return safe_shapiro(x), "Shapiro-Wilk", n
+    if mode == "dagostino":
+        d = x - x.mean()
+        d2 = d * d
+        p = dagostino_k2(n, d2.mean(), (d2 * d).mean(), (d2 * d2).mean())
+        return float(p), "D'Agostino K²", n
+    sample = stratified_subsample(x, SHAPIRO_MAX_N)
+    return safe_shapiro(sample), "Shapiro-Wilk (subsample)", len(sample)
+
+
+def normality_screen(frame, data_key, rows=None, mode="subsample"):
+    """Normality p-value per column of `frame`, batched over the worker pool.
+
+    Returns a frame with the p-value, the test used and the rows it ran on.
+    Cached per (data, column, row filter, mode): by default each column uses
+    its own non-missing rows; `rows` (boolean mask) restricts every column to
+    a subset, as in the single-pair analysis after dropna.
+    """
+    cache = get_cache()
+    cols = list(frame.columns)
+    out, todo = {}, {}
+    for c in cols:
+        if rows is None:
+            key, values = ("normality", data_key, c, "own", mode), None
+        else:
+            own = frame[c].notna().to_numpy()
+            subset = rows & own
+            key, values = ("normality", data_key, c, subset_key(subset, own), mode), subset
+        out[c] = cache.get(key)
+        if out[c] is None:
+            todo[c] = (key, values)
+
+    def run(c):
+        x = frame[c].to_numpy(np.float64, na_value=np.nan)
+        subset = todo[c][1]
+        return normality_test(x[subset] if subset is not None else x[~np.isnan(x)], mode)
+
+    for c, result in zip(todo, get_worker_pool().map(run, todo)):
+        out[c] = cache.put(todo[c][0], result)
+    return pd.DataFrame([out[c] for c in cols], index=cols, columns=["p", "test", "n"])
+
+
+def streamed_normality(moments, cols, data_key, mode):
+    """normality_screen() entries that streamed moments can answer.
+
+    normality_test() uses K² only in mode "dagostino" above SHAPIRO_MAX_N
+    rows; those columns are computed from `moments` (same formulas) and cached
+    under the screen's keys, so the pair rule looks them up. The other columns
+    still need their values.
+    """
+    if mode != "dagostino":
+        return pd.DataFrame(columns=["p", "test", "n"])
+    cache = get_cache()
+    p = moments.normality_p()
+    out = {}
+    for j, c in enumerate(cols):
+        if moments.n[j] > SHAPIRO_MAX_N:
+            key = ("normality", data_key, c, "own", mode)
+            out[c] = cache.put(key, (float(p[j]), "D'Agostino K²", int(moments.n[j])))
+    return pd.DataFrame(list(out.values()), index=list(out), columns=["p", "test", "n"])
+
+
+def use_pearson_rule(p_x, p_y):
+    """Pearson if both p-values are available and > alpha; otherwise Spearman.
+    Works elementwise on arrays (NaN compares False)."""
+    return (np.asarray(p_x) > NORMALITY_ALPHA) & (np.asarray(p_y) > NORMALITY_ALPHA)
+
+# =====================
+# Correlation Matrices
+# =====================
+# All-pairs mode: matrix products instead of a pearsonr/spearmanr call per pair.
+# Missing values are handled pairwise-complete, matching the per-pair dropna()
+# of the single-pair analysis. Ranks are computed once per column.
+def numeric_matrix(frame):
+    """float64 (n x p) matrix; nullable/downcast columns become NaN-aware floats."""
+    return frame.to_numpy(np.float64, na_value=np.nan)
+
+
+def corr_pvalues(r, n):
+    """Two-sided p-values for correlations r on n rows (t-test, as scipy uses)."""
+    dof = np.asarray(n, dtype=np.float64) - 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_stat = r * np.sqrt(dof / ((1.0 - r) * (1.0 + r)))
+        p = 2 * student_t.sf(np.abs(t_stat), dof)
+    return np.where(dof > 0, p, np.nan)
+
+
+def adjust_pvalues(p, method="bh", n_tests=None):
+    """Benjamini-Hochberg q-values ("bh") or Holm adjusted p-values ("holm").
+
+    One sort and a cumulative min/max over the whole family; NaN p-values stay
+    NaN and are not counted. `n_tests` is the family size when only part of it
+    is passed (top-K): Holm is then applied with the full size, and BH is a
+    conservative bound.
+    """
+    p = np.asarray(p, dtype=np.float64)
+    out = np.full(p.shape, np.nan)
+    ok = ~np.isnan(p)
+    order = np.argsort(p[ok])
+    ranked = p[ok][order]
+    m = n_tests or len(ranked)
+    i = np.arange(1, len(ranked) + 1)
+    if method == "bh":
+        adjusted = np.minimum.accumulate((m * ranked / i)[::-1])[::-1]
+    else:
+        adjusted = np.maximum.accumulate((m - i + 1) * ranked)
+    values = np.empty(len(ranked))
+    values[order] = np.minimum(adjusted, 1.0)
+    out[ok] = values
+    return out
+
+
+def add_adjusted(table, p_columns, n_tests=None):
+    """BH and Holm columns next to each raw p-value column (stored with the cached table)."""
+    for col in p_columns:
+        table[f"{col} (BH q)"] = adjust_pvalues(table[col], "bh", n_tests)
+        table[f"{col} (Holm)"] = adjust_pvalues(table[col], "holm", n_tests)
+    return table
+
+
+def filter_adjusted(table, correction, q_max):
+    """The cached table with one correction's columns, keeping pairs where any
+    adjusted p-value is at most q_max (a view for display; no test is re-run)."""
+    other = " (Holm)" if correction == "bh" else " (BH q)"
+    table = table[[c for c in table.columns if not str(c).endswith(other)]]
+    adjusted = [c for c in table.columns if str(c).endswith((" (BH q)", " (Holm)"))]
+    if q_max < 1.0 and adjusted:
+        table = table[(table[adjusted] <= q_max).any(axis=1)]
+    return table
+
+
+class PairwiseSums:
+    """Mergeable pairwise-complete sums between the columns of x and of y.
+
+    For every pair (i, j), over the rows where both x_i and y_j are present: the
+    row count, the sum and sum of squares of each side, and the cross-product.
+    All pairs come from a few products with the missingness masks. Values are
+    shifted by a fixed per-column reference so the sums stay well-conditioned.
+    Without y the sums are for all pairs of columns of x.
+    """
+
+    def __init__(self, shift_x, shift_y=None):
+        self.square = shift_y is None
+        self.shift_x = np.asarray(shift_x, dtype=np.float64)
+        self.shift_y = self.shift_x if self.square else np.asarray(shift_y, dtype=np.float64)
+        shape = (len(self.shift_x), len(self.shift_y))
+        self.n = np.zeros(shape)
+        self.sx = np.zeros(shape)  # sx[i, j]: sum of x_i where x_i and y_j are present
+        self.sy = np.zeros(shape)
+        self.sxx = np.zeros(shape)
+        self.syy = np.zeros(shape)
+        self.sxy = np.zeros(shape)
+
+    @staticmethod
+    def reference(x):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN columns
+            return np.nan_to_num(np.nanmean(x, axis=0))
+
+    @classmethod
+    def from_block(cls, x, y=None):
+        shift_y = None if y is None else cls.reference(y)
+        return cls(cls.reference(x), shift_y).update(x, y)
+
+    @staticmethod
+    def _masked(x, shift):
+        x = x - shift
+        mask = ~np.isnan(x)
+        return mask.astype(np.float64), np.where(mask, x, 0.0)
+
+    def update(self, x, y=None):
+        mx, x0 = self._masked(x, self.shift_x)
+        my, y0 = (mx, x0) if self.square else self._masked(y, self.shift_y)
+        self.n += mx.T @ my
+        sx, sxx = x0.T @ my, (x0 ** 2).T @ my
+        self.sx += sx
+        self.sxx += sxx
+        if self.square:
+            self.sy += sx.T
+            self.syy += sxx.T
+        else:
+            self.sy += mx.T @ y0
+            self.syy += mx.T @ (y0 ** 2)
+        self.sxy += x0.T @ y0
+        return self
+
+    def merge(self, other):
+        assert np.array_equal(self.shift_x, other.shift_x), "sums must share a shift"
+        assert np.array_equal(self.shift_y, other.shift_y), "sums must share a shift"
+        for name in ("n", "sx", "sy", "sxx", "syy", "sxy"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        return self
+
+    def corr(self):
+        """Pairwise-complete Pearson r; NaN below 3 rows or with a constant side."""
+        n = self.n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = self.sxy - self.sx * self.sy / n
+            var_x = self.sxx - self.sx ** 2 / n
+            var_y = self.syy - self.sy ** 2 / n
+            r = np.clip(cov / np.sqrt(var_x * var_y), -1.0, 1.0)
+        constant = (var_x <= 1e-12 * self.sxx) | (var_y <= 1e-12 * self.syy)
+        r[(n < 3) | constant] = np.nan
+        return r
+
+
+RANK_CELLS = 8_000_000  # rows x column block x partner block of restricted ranks held at once
+
+
+def sorted_runs(v):
+    """Row order of v's present values and the [start, end) of its tie runs
+    (None when there are no ties, so untied columns keep just their order)."""
+    order = np.flatnonzero(~np.isnan(v))
+    order = order[np.argsort(v[order], kind="stable")]
+    values = v[order]
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]]) if len(values) else np.empty(0, int)
+    if len(starts) == len(order):
+        return order, None, None
+    return order, starts, np.r_[starts[1:], len(values)]
+
+
+def restricted_ranks(runs, present):
+    """Average ranks of one column within the rows it shares with each partner.
+
+    `runs` is the column's sorted_runs() and `present` the partners' 0/1
+    presence matrix (n x k). A cumulative count of each partner's present rows
+    along the column's order gives, per tie run, the shared rows below and
+    inside it, so all partners are ranked at once. Rows stay in the column's
+    sorted order (runs[0]); entries are 0 where the partner has no value.
+    """
+    order, starts, ends = runs
+    present = present[order]
+    if starts is None:  # no ties: the rank is the running count itself
+        ranks = np.cumsum(present, axis=0, dtype=np.float64)
+    else:
+        inside = np.add.reduceat(present, starts, axis=0, dtype=np.float64)
+        below = np.cumsum(inside, axis=0) - inside
+        ranks = np.repeat(below + (inside + 1) / 2, ends - starts, axis=0)
+    ranks *= present
+    return ranks
+
+
+def restricted_spearman(x, m):
+    """Pairwise-complete Spearman matrix of x (n x p) with per-pair ranks.
+
+    `m` holds the shared-row counts (PairwiseSums.n). Each column is sorted
+    once. For a tile of columns and partners, restricted_ranks() gives the
+    columns' ranks within every partner's rows and the partners' ranks within
+    theirs; the Spearman sums are then column-wise products (the ranks' mean
+    on m shared rows is (m + 1) / 2). Tiles are sized so that at most
+    RANK_CELLS ranks are held at once.
+    """
+    n, p = x.shape
+    present = ~np.isnan(x)
+    runs = [sorted_runs(x[:, j]) for j in range(p)]
+    r = np.full((p, p), np.nan)
+    block = int(min(p, max(1, np.sqrt(RANK_CELLS / max(n, 1)))))
+    for i0 in range(0, p, block):
+        rows = np.arange(i0, min(i0 + block, p))
+        # Partners from i0 on: the lower triangle is filled from the upper one.
+        for j0 in range(i0, p, block):
+            cols = np.arange(j0, min(j0 + block, p))
+            # theirs[:, t, k]: rank of x_cols[t] within the rows shared with x_rows[k], in row order.
+            theirs = np.zeros((n, len(cols), len(rows)))
+            for t, j in enumerate(cols):
+                theirs[runs[j][0], t] = restricted_ranks(runs[j], present[:, rows])
+            partners = present[:, cols]
+            for k, i in enumerate(rows):
+                a = restricted_ranks(runs[i], partners)  # rank of x_i per partner, in x_i's order
+                b = theirs[runs[i][0], :, k]
+                mi = m[i, cols]
+                centre = mi * ((mi + 1) / 2) ** 2
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    r[i, cols] = r[cols, i] = (np.einsum("rj,rj->j", a, b) - centre) / np.sqrt(
+                        (np.einsum("rj,rj->j", a, a) - centre) * (np.einsum("rj,rj->j", b, b) - centre)
+                    )
+    r = np.clip(r, -1.0, 1.0)
+    r[m < 3] = np.nan
+    return r
+
+
+def correlation_matrices(x, previous=None):
+    """Pairwise-complete Pearson and Spearman matrices (with p-values) of x (n x p).
+
+    `previous` is the cached result for the first rows of x (before appended
+    waves): its Pearson cross-product sums are extended with the new rows only.
+    Spearman ranks shift with every new row, so Spearman is recomputed.
+    """
+    if previous is not None:
+        sums = copy.deepcopy(previous["sums"]).update(x[previous["rows"]:])
+    else:
+        sums = PairwiseSums.from_block(x)
+    n = sums.n
+    r_p = sums.corr()
+
+    # Column ranks are only valid for pairs whose rows are the columns' own rows
+    # (identical missingness); otherwise every pair is ranked on its shared rows.
+    counts = np.diag(n)
+    same_rows = (n == counts[:, None]) & (n == counts[None, :])
+    if same_rows.all():
+        ranks = rankdata(x, axis=0, nan_policy="omit")  # average ranks, as spearmanr
+        r_s = PairwiseSums.from_block(ranks).corr()
+    else:
+        r_s = restricted_spearman(x, n)
+
+    return {
+        "n": n,
+        "pearson": r_p,
+        "pearson_p": corr_pvalues(r_p, n),
+        "spearman": r_s,
+        "spearman_p": corr_pvalues(r_s, n),
+        "sums": sums,
+        "rows": len(x),
+    }
+
+
+def partial_correlations(result, cols, targets, controls):
+    """Pearson and Spearman partial correlations among `targets` given `controls`.
+
+    From one correlation matrix (over `cols`, which hold both lists): the Schur
+    complement R_tt - R_tc R_cc^-1 R_ct, rescaled to unit diagonal, is the
+    partial correlation matrix of all targets at once (one solve against R_cc;
+    with every other column as control this is -P_ij / sqrt(P_ii P_jj) of the
+    precision matrix). p-values use n - 2 - len(controls) degrees of freedom.
+    Same layout as correlation_matrices(), so pairs_table() can render it.
+    """
+    pos = {c: i for i, c in enumerate(cols)}
+    t = [pos[c] for c in targets]
+    c = [pos[c] for c in controls]
+    n = np.broadcast_to(result["n"], (len(cols), len(cols)))[np.ix_(t, t)]
+    out = {"n": n}
+    for method in ("pearson", "spearman"):
+        r = result[method]
+        s = r[np.ix_(t, t)]
+        if c:
+            r_tc, r_cc = r[np.ix_(t, c)], r[np.ix_(c, c)]
+            try:
+                coef = np.linalg.solve(r_cc, r_tc.T)
+            except np.linalg.LinAlgError:
+                # Pairwise-complete matrices can be singular; use the pseudo-inverse.
+                coef = np.linalg.pinv(r_cc) @ r_tc.T
+            s = s - r_tc @ coef
+        d = np.sqrt(np.diag(s))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            partial = np.clip(s / np.outer(d, d), -1.0, 1.0)
+        np.fill_diagonal(partial, 1.0)
+        out[method] = partial
+        out[f"{method}_p"] = corr_pvalues(partial, n - len(c))
+    return out
+
+
+def pairs_table(cols, result, kendall=None):
+    """Long (one row per pair) view of the upper triangle, for sorting/filtering."""
+    i, j = np.triu_indices(len(cols), k=1)
+    names = np.asarray(cols, dtype=object)
+    table = pd.DataFrame(
+        {
+            "X": names[i],
+            "Y": names[j],
+            "n": np.broadcast_to(result["n"], (len(cols), len(cols)))[i, j].astype(int),
+            "Pearson r": result["pearson"][i, j],
+            "Pearson p": result["pearson_p"][i, j],
+            "Spearman r": result["spearman"][i, j],
+            "Spearman p": result["spearman_p"][i, j],
+        }
+    )
+    if kendall is not None:
+        table["Kendall tau-b"] = kendall["tau"][i, j]
+        table["Kendall p"] = kendall["p"][i, j]
+    return table
+
+
+def top_k_associations(x, k, normal_p, block=256):
+    """The k strongest |r| pairs of x's columns, scanning the matrix in blocks.
+
+    Only a block of sums and a bounded heap are held (O(k + block^2) memory),
+    never the full p x p matrix. Each pair uses the single-pair method rule on
+    the per-column Shapiro p-values `normal_p` (from the normality screen).
+    Spearman pairs with differing missingness are screened on column ranks. A
+    pool of candidates is therefore re-scored exactly (per-pair dropna) before
+    the final cut. Returns (i, j, n, method, r, p) tuples, strongest first.
+    """
+    p = x.shape[1]
+    normal_p = np.asarray(normal_p, dtype=np.float64)
+    ranks = rankdata(x, axis=0, nan_policy="omit")
+    pool = max(2 * k, k + 50)
+    heap = []
+    for a0 in range(0, p, block):
+        a = slice(a0, min(a0 + block, p))
+        for b0 in range(a0, p, block):
+            b = slice(b0, min(b0 + block, p))
+            pearson = use_pearson_rule(normal_p[a][:, None], normal_p[b][None, :])
+            r = np.where(
+                pearson,
+                PairwiseSums.from_block(x[:, a], x[:, b]).corr(),
+                PairwiseSums.from_block(ranks[:, a], ranks[:, b]).corr(),
+            )
+            score = np.abs(r)
+            if a0 == b0:
+                score = np.triu(score, k=1)  # each pair once, no diagonal
+            flat = np.nan_to_num(score, nan=-1.0).ravel()
+            take = min(pool, flat.size)
+            for idx in np.argpartition(flat, flat.size - take)[flat.size - take:]:
+                if flat[idx] <= 0:
+                    continue
+                i, j = divmod(int(idx), score.shape[1])
+                item = (float(flat[idx]), a0 + i, b0 + j)
+                if len(heap) < pool:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+
+    results = []
+    for _, i, j in heap:
+        ok = ~(np.isnan(x[:, i]) | np.isnan(x[:, j]))
+        xi, xj = x[ok, i], x[ok, j]
+        if use_pearson_rule(normal_p[i], normal_p[j]):
+            method, (r, pval) = "Pearson", pearsonr(xi, xj)
+        else:
+            method, (r, pval) = "Spearman", spearmanr(xi, xj)
+        if not np.isnan(r):
+            results.append((i, j, int(ok.sum()), method, float(r), float(pval)))
+    results.sort(key=lambda t: -abs(t[4]))
+    return results[:k]
+
+
+def plot_heatmap(r, cols, title):
+    size = min(4 + 0.25 * len(cols), 20)
+    fig, ax = plt.subplots(figsize=(size, size * 0.8))
+    im = ax.imshow(r, cmap="coolwarm", vmin=-1, vmax=1)
+    if len(cols) <= 60:
+        ax.set_xticks(range(len(cols)))
+        ax.set_xticklabels(cols, rotation=90, fontsize=7)
+        ax.set_yticks(range(len(cols)))
+        ax.set_yticklabels(cols, fontsize=7)
+    fig.colorbar(im, ax=ax, shrink=0.8)
+    ax.set_title(title)
+    fig.tight_layout()
+    return fig
+
+# =====================
+# Survey Weights
+# =====================
+# Kernels are column-vectorised: one sort of the (n x p) matrix serves every
+# weighted quantile, and the correlations are a handful of dot products.
+def valid_weights(w):
+    """Mask of usable weights (present and positive)."""
+    return np.nan_to_num(w, nan=0.0) > 0
+
+
+def weighted_describe(x, w, columns):
+    """describe()-style table of x (n x p) under survey weights w.
+
+    std uses the weighted variance with the n / (n - 1) correction; quartiles
+    interpolate between the cumulative-weight midpoints of the sorted values.
+    """
+    valid = ~np.isnan(x) & valid_weights(w)[:, None]
+    wm = np.where(valid, w[:, None], 0.0)
+    count = valid.sum(axis=0)
+    total = wm.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = (wm * np.where(valid, x, 0.0)).sum(axis=0) / total
+        dev = np.where(valid, x - mean, 0.0)
+        var = (wm * dev ** 2).sum(axis=0) / total * count / (count - 1)
+    order = np.argsort(np.where(valid, x, np.inf), axis=0, kind="stable")
+    xs = np.take_along_axis(x, order, axis=0)
+    ws = np.take_along_axis(wm, order, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mid = (np.cumsum(ws, axis=0) - ws / 2) / total
+    quartiles = np.full((3, x.shape[1]), np.nan)
+    for j in np.flatnonzero(count):
+        quartiles[:, j] = np.interp([0.25, 0.5, 0.75], mid[:count[j], j], xs[:count[j], j])
+    last = np.maximum(count - 1, 0)
+    return pd.DataFrame(
+        {
+            "count": count,
+            "mean": mean,
+            "std": np.sqrt(var),
+            "min": np.where(count > 0, xs[0], np.nan),
+            "25%": quartiles[0],
+            "50%": quartiles[1],
+            "75%": quartiles[2],
+            "max": np.where(count > 0, xs[last, np.arange(x.shape[1])], np.nan),
+        },
+        index=columns,
+    )
+
+
+def weighted_ranks(v, w):
+    """Weighted mid-ranks: the weight below each value plus half the weight of
+    its tie group (unit weights give average ranks minus 1/2)."""
+    order = np.argsort(v, kind="stable")
+    vs, ws = v[order], w[order]
+    starts = np.flatnonzero(np.r_[True, vs[1:] != vs[:-1]])
+    group_w = np.add.reduceat(ws, starts)
+    below = np.cumsum(group_w) - group_w
+    ranks = np.empty_like(ws)
+    ranks[order] = np.repeat(below + group_w / 2, np.diff(np.r_[starts, len(vs)]))
+    return ranks
+
+
+def weighted_pearson(x, y, w):
+    """Weighted Pearson r; the p-value is the t-test on the Kish effective n."""
+    total = w.sum()
+    dx = x - (w @ x) / total
+    dy = y - (w @ y) / total
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = (w * dx) @ dy / np.sqrt(((w * dx) @ dx) * ((w * dy) @ dy))
+    if np.isnan(r):
+        return np.nan, np.nan
+    r = float(np.clip(r, -1.0, 1.0))
+    return r, float(corr_pvalues(r, total ** 2 / (w @ w)))
+
+
+def weighted_spearman(x, y, w):
+    """Weighted-rank Spearman: weighted Pearson of the weighted mid-ranks."""
+    return weighted_pearson(weighted_ranks(x, w), weighted_ranks(y, w), w)
+
+# =====================
+# Grouped Statistics (split by)
+# =====================
+MAX_GROUPS = 500  # numeric columns (e.g. regency codes) with at most this many values can split too
+QUARTILES = {0.25: "25%", 0.5: "50%", 0.75: "75%"}
+
+
+def grouped_describe(frame, labels):
+    """describe() for every group of `labels`, indexed by (group, column).
+
+    The labels are factorised once; the aggregates and quartiles all reuse that
+    grouping, so the frame is not filtered per segment.
+    """
+    grouped = frame.astype(np.float64).groupby(labels.to_numpy(), observed=True, sort=True)
+    stats = grouped.agg(["count", "mean", "std", "min", "max"]).stack(level=0, future_stack=True)
+    quartiles = grouped.quantile(list(QUARTILES)).unstack(level=-1).stack(level=0, future_stack=True)
+    table = stats.join(quartiles.rename(columns=QUARTILES))
+    return table[["count", "mean", "std", "min", "25%", "50%", "75%", "max"]]
+
+
+def grouped_weighted_describe(x, w, labels, columns):
+    """weighted_describe() per group: rows sorted once by group code, then sliced."""
+    codes, groups = pd.factorize(labels, sort=True)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(groups) + 1))
+    tables = {
+        group: weighted_describe(x[order[lo:hi]], w[order[lo:hi]], columns)
+        for group, lo, hi in zip(groups, bounds[:-1], bounds[1:])
+    }
+    return pd.concat(tables) if tables else weighted_describe(x[:0], w[:0], columns).iloc[:0]
+
+
+def group_ranks(v, codes, w):
+    """Weighted mid-ranks of v within each group, from one lexsort by (code, v).
+
+    Each rank is the weight of the group's rows below the value plus half the
+    weight of its tie group; with unit weights these are average ranks - 1/2.
+    """
+    order = np.lexsort((v, codes))
+    cs, vs, ws = codes[order], v[order], w[order]
+    before = np.cumsum(ws) - ws
+    group_start = np.searchsorted(cs, cs, side="left")
+    ties = np.flatnonzero(np.r_[True, (cs[1:] != cs[:-1]) | (vs[1:] != vs[:-1])])
+    tie_w = np.add.reduceat(ws, ties)
+    sizes = np.diff(np.r_[ties, len(vs)])
+    ranks = np.empty_like(ws)
+    ranks[order] = np.repeat(before[ties] + tie_w / 2, sizes) - before[group_start]
+    return ranks
+
+
+def grouped_correlation(x, y, labels, w=None, method="Pearson"):
+    """Pearson or Spearman r of x vs y within every group of `labels`.
+
+    All per-group sums are np.bincount passes over the group codes (Spearman
+    first ranks within groups via group_ranks), so there is no per-group loop.
+    Returns a table indexed by group with n, r and p (Kish effective n when
+    weighted).
+    """
+    codes, groups = pd.factorize(labels, sort=True)
+    keep = codes >= 0
+    codes, x, y = codes[keep], x[keep], y[keep]
+    w = np.ones(len(x)) if w is None else w[keep]
+    k = len(groups)
+    if method == "Spearman":
+        x, y = group_ranks(x, codes, w), group_ranks(y, codes, w)
+    total = np.bincount(codes, w, k)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dx = x - (np.bincount(codes, w * x, k) / total)[codes]
+        dy = y - (np.bincount(codes, w * y, k) / total)[codes]
+        sxx = np.bincount(codes, w * dx * dx, k)
+        syy = np.bincount(codes, w * dy * dy, k)
+        r = np.clip(np.bincount(codes, w * dx * dy, k) / np.sqrt(sxx * syy), -1.0, 1.0)
+        n_eff = total ** 2 / np.bincount(codes, w * w, k)
+    n = np.bincount(codes, minlength=k)
+    r = np.where(n >= 3, r, np.nan)  # as the single pair: fewer than 3 rows give no r
+    return pd.DataFrame({"n": n, "r": r, "p": corr_pvalues(r, np.where(n > 2, n_eff, 0))}, index=groups)
+
+# =====================
+# Rank Cache (Spearman)
+# =====================
+# Ranking is the expensive part of Spearman. Ranks are cached per column and
+# row subset together with the tie term, so a repeat run is one dot product.
+def cached_ranks(frame, column, data_key, rows):
+    """Average ranks of `column` on the `rows` subset, plus the tie term
+    sum(t^3 - t) over tie groups; cached per (data, column, row filter)."""
+    own = frame[column].notna().to_numpy()
+    subset = rows & own
+    cache = get_cache()
+    key = ("ranks", data_key, column, subset_key(subset, own))
+    entry = cache.get(key)
+    if entry is None:
+        values = frame[column].to_numpy(np.float64, na_value=np.nan)[subset]
+        _, counts = np.unique(values, return_counts=True)
+        counts = counts.astype(np.float64)
+        entry = cache.put(key, {"ranks": rankdata(values), "ties": float((counts ** 3 - counts).sum())})
+    return entry
+
+
+def spearman_cached(frame, col_x, col_y, data_key, rows):
+    """spearmanr(x, y) on `rows` from cached ranks: O(n) instead of two sorts.
+
+    With average ranks 1..n the rank mean is (n + 1) / 2 and the centred sum of
+    squares is (n^3 - n - ties) / 12, so only the cross-product is computed.
+    The p-value is the same t-test spearmanr uses.
+    """
+    rx = cached_ranks(frame, col_x, data_key, rows)
+    ry = cached_ranks(frame, col_y, data_key, rows)
+    n = len(rx["ranks"])
+    mean = (n + 1) / 2.0
+    ss_x = (n ** 3 - n - rx["ties"]) / 12.0
+    ss_y = (n ** 3 - n - ry["ties"]) / 12.0
+    if ss_x <= 0 or ss_y <= 0:
+        return np.nan, np.nan
+    r = float(np.clip((rx["ranks"] @ ry["ranks"] - n * mean * mean) / np.sqrt(ss_x * ss_y), -1.0, 1.0))
+    return r, float(corr_pvalues(r, n))
+
+# =====================
+# Kendall Tau-b
+# =====================
+# Discordant pairs are inversions of y once rows are ordered by x. They are
+# counted by MSD radix partitioning over the bits of y's integer codes (the
+# merge-sort count split by value instead of position): O(n log K) for K
+# distinct values, i.e. a handful of linear passes for Likert items.
+def inversions(s, groups, levels):
+    """Pairs j < i with s[j] > s[i] inside each run of equal (non-decreasing)
+    `groups`; s holds integer codes below 2**levels. Also returns the sizes of
+    the final runs of equal (group, s)."""
+    n = len(s)
+    idx = np.arange(n)
+    count = 0
+    for b in range(levels - 1, -1, -1):
+        bit = (s >> b) & 1
+        new = np.r_[True, groups[1:] != groups[:-1]]
+        start = np.maximum.accumulate(np.where(new, idx, 0))
+        run = np.cumsum(new) - 1
+        ones = np.cumsum(bit) - bit
+        ones -= ones[start]  # ones before each element within its run
+        count += int(ones[bit == 0].sum())
+        # Stable partition of every run: zeros first, then ones.
+        zeros_in_run = np.bincount(run[bit == 0], minlength=run[-1] + 1)
+        dest = start + np.where(bit == 0, idx - start - ones, zeros_in_run[run] + ones)
+        s_next, groups_next = np.empty_like(s), np.empty_like(groups)
+        s_next[dest], groups_next[dest] = s, run * 2 + bit
+        s, groups = s_next, groups_next
+    return count, np.diff(np.flatnonzero(np.r_[True, groups[1:] != groups[:-1], True]))
+
+
+def tie_sums(counts):
+    """Tie terms of scipy's kendalltau: sum t(t-1)/2, t(t-1)(t-2), t(t-1)(2t+5)."""
+    t = counts[counts > 1].astype(np.float64)
+    return (t * (t - 1)).sum() / 2, (t * (t - 1) * (t - 2)).sum(), (t * (t - 1) * (2 * t + 5)).sum()
+
+
+def kendall_sorted(gx, sy):
+    """Kendall tau-b and asymptotic p-value (as scipy's kendalltau) from integer
+    codes: gx sorted ascending and sy the matching y codes."""
+    n = len(sy)
+    if n < 3:
+        return np.nan, np.nan
+    levels = int(sy.max()).bit_length()
+    total, _ = inversions(sy, np.zeros(n, np.int64), levels)
+    within, joint = inversions(sy, gx, levels)  # pairs tied in x are not discordant
+    discordant = total - within
+    x_tie, x0, x1 = tie_sums(np.bincount(gx))
+    y_tie, y0, y1 = tie_sums(np.bincount(sy))
+    pairs = n * (n - 1) / 2
+    con_minus_dis = pairs - x_tie - y_tie + tie_sums(joint)[0] - 2 * discordant
+    if pairs == x_tie or pairs == y_tie:
+        return np.nan, np.nan
+    tau = float(np.clip(con_minus_dis / np.sqrt((pairs - x_tie) * (pairs - y_tie)), -1.0, 1.0))
+    m = n * (n - 1.0)
+    var = (m * (2 * n + 5) - x1 - y1) / 18 + 2 * x_tie * y_tie / m + x0 * y0 / (9 * m * (n - 2))
+    return tau, float(chi2.sf(con_minus_dis ** 2 / var, 1))
+
+
+def rank_codes(v):
+    """Dense integer codes of v (equal values share a code) and their stable order."""
+    codes = np.unique(v, return_inverse=True)[1].astype(np.int64)
+    return codes, np.argsort(codes, kind="stable")
+
+
+def kendall_pair(x, y):
+    """Kendall tau-b of two complete float arrays."""
+    gx, order = rank_codes(x)
+    return kendall_sorted(gx[order], rank_codes(y)[0][order])
+
+
+def kendall_matrix(x):
+    """Pairwise-complete Kendall tau-b (and p) between the columns of x (n x p).
+
+    Every column is coded and sorted once; each pair filters the shared x order
+    by its missing-value mask instead of sorting again. Pairs run on the pool.
+    """
+    p = x.shape[1]
+    valid = ~np.isnan(x)
+    coded = [rank_codes(np.where(valid[:, j], x[:, j], np.inf)) for j in range(p)]
+
+    def run(pair):
+        i, j = pair
+        order = coded[i][1]
+        order = order[valid[order, i] & valid[order, j]]
+        return kendall_sorted(coded[i][0][order], coded[j][0][order])
+
+    pairs = list(zip(*np.triu_indices(p, k=1)))
+    tau, pval = np.eye(p), np.zeros((p, p))
+    for (i, j), (t, pv) in zip(pairs, get_worker_pool().map(run, pairs)):
+        tau[i, j] = tau[j, i] = t
+        pval[i, j] = pval[j, i] = pv
+    return {"tau": tau, "p": pval}
+
+# =====================
+# Bootstrap Confidence Intervals
+# =====================
+# A resample is a vector of row multiplicities, so a block of resamples is one
+# bincount and the correlation is a weighted one. Spearman needs no re-sort:
+# the mid-ranks within a resample follow from the cached ranks' order and ties.
+BOOTSTRAP_SEED = 2024
+BOOTSTRAP_CELLS = 4_000_000  # resamples x rows per block (a few arrays of this size)
+
+
+def tie_groups(sorted_values):
+    """Starts and sizes of runs of equal values; None when all values differ."""
+    starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+    if len(starts) == len(sorted_values):
+        return None
+    return starts, np.diff(np.r_[starts, len(sorted_values)])
+
+
+def mid_ranks(c, ties):
+    """Mid-ranks (shifted by -1/2) of sorted positions under the multiplicities in
+    each row of c: the weight below plus half the weight of the tie group."""
+    if ties is None:
+        return np.cumsum(c, axis=1) - c / 2
+    starts, sizes = ties
+    tie_w = np.add.reduceat(c, starts, axis=1)
+    return np.repeat(np.cumsum(tie_w, axis=1) - tie_w / 2, sizes, axis=1)
+
+
+def bootstrap_corr(x, y, method="Pearson", w=None, ranks=None, resamples=10_000, level=0.95, seed=BOOTSTRAP_SEED):
+    """Percentile bootstrap CI of Pearson / Spearman r (weighted when w is given).
+
+    Pearson needs only the weighted sums of (1, x, y, x², y², xy): one matrix
+    product per block. For Spearman rows are resampled in x-sorted order, so x's
+    mid-ranks are a cumulative sum and y's need one gather into y order.
+    `ranks` are the cached average ranks of x and y. Blocks run on the worker
+    pool and share the inputs; each block has its own seed, so the interval
+    does not depend on scheduling.
+    """
+    n = len(x)
+    # Unweighted counts and mid-ranks are exact in float32 (half the memory traffic).
+    dtype = np.float32 if w is None and method == "Spearman" else np.float64
+    w = np.ones(n, dtype) if w is None else w
+    if method == "Spearman":
+        if ranks is None:
+            ranks = (rankdata(x), rankdata(y))
+        order_x = np.argsort(ranks[0], kind="stable")
+        ry = ranks[1][order_x]
+        order_y = np.argsort(ry, kind="stable")
+        back = np.argsort(order_y)
+        ties_x, ties_y = tie_groups(ranks[0][order_x]), tie_groups(ry[order_y])
+        w = w[order_x]
+    else:
+        # Centred once: the per-resample sums then stay well conditioned.
+        x, y = x - x.mean(), y - y.mean()
+        basis = np.column_stack([w, w * x, w * y, w * x * x, w * y * y, w * x * y])
+
+    def run(job):
+        block, size = job
+        rng = np.random.default_rng([seed, block])
+        idx = rng.integers(0, n, (size, n))
+        idx += n * np.arange(size)[:, None]
+        c = np.bincount(idx.ravel(), minlength=size * n).reshape(size, n).astype(dtype)
+        if method == "Spearman":
+            c *= w
+            # Ranks centred on the weighted mean rank (total / 2) before the products.
+            half = (c.sum(axis=1, dtype=np.float64) / 2).astype(dtype)[:, None]
+            rx = mid_ranks(c, ties_x) - half
+            ry = np.take(mid_ranks(np.take(c, order_y, axis=1), ties_y) - half, back, axis=1)
+            crx = c * rx
+            sxx = np.einsum("ij,ij->i", crx, rx, dtype=np.float64)
+            syy = np.einsum("ij,ij->i", c * ry, ry, dtype=np.float64)
+            sxy = np.einsum("ij,ij->i", crx, ry, dtype=np.float64)
+        else:
+            total, sx, sy, sxx, syy, sxy = (c @ basis).T
+            sxx, syy, sxy = sxx - sx * sx / total, syy - sy * sy / total, sxy - sx * sy / total
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return sxy / np.sqrt(sxx * syy)
+
+    size = max(1, min(resamples, BOOTSTRAP_CELLS // max(n, 1)))
+    jobs = [(b, min(size, resamples - start)) for b, start in enumerate(range(0, resamples, size))]
+    r = np.concatenate(list(get_worker_pool().map(run, jobs)))
+    r = r[~np.isnan(r)]
+    if not len(r):
+        return np.nan, np.nan
+    alpha = (1 - level) / 2
+    low, high = np.quantile(np.clip(r, -1.0, 1.0), [alpha, 1 - alpha])
+    return float(low), float(high)
+
+# =====================
+# Permutation Test
+# =====================
+# Shuffling one column leaves both means and variances unchanged (unweighted),
+# so a batch of permuted correlations is one matrix-vector product.
+PERMUTATION_SEED = 7
+PERMUTATION_CELLS = 2_000_000  # permutations x rows per batch
+MAX_PERMUTATIONS = 200_000
+EXACT_MAX_N = 8  # 8! = 40320 orderings are enumerated outright
+
+
+def permutation_pvalue(a, b, w=None, precision=0.005, max_permutations=MAX_PERMUTATIONS, seed=PERMUTATION_SEED):
+    """Two-sided permutation p-value of the (weighted) correlation of scores a, b.
+
+    a and b are raw values for Pearson or (weighted) ranks for Spearman. Up to
+    EXACT_MAX_N rows every ordering is enumerated. Otherwise rounds of batches
+    run on the worker pool until the 95% half-width of the Monte Carlo
+    estimate is at most `precision` (or max_permutations is reached).
+    """
+    n = len(a)
+    if w is None:
+        a = (a - a.mean()) / np.sqrt(((a - a.mean()) ** 2).sum())
+        b = (b - b.mean()) / np.sqrt(((b - b.mean()) ** 2).sum())
+
+        def corr(perm_a):
+            return perm_a @ b
+    else:
+        # Weights stay with b's rows, so the weighted mean and variance of the
+        # shuffled a change per permutation: two more products with w.
+        total = w.sum()
+        wb = w * (b - (w @ b) / total)
+        sbb = wb @ (b - (w @ b) / total)
+
+        def corr(perm_a):
+            s1, s2 = perm_a @ w, (perm_a * perm_a) @ w
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return (perm_a @ wb) / np.sqrt((s2 - s1 * s1 / total) * sbb)
+
+    observed = float(corr(a[None, :])[0])
+    if np.isnan(observed):
+        return {"p": np.nan, "permutations": 0, "exact": False, "half_width": np.nan}
+    # Relative tolerance so tied (Likert) statistics count as "as extreme".
+    threshold = abs(observed) * (1 - 1e-9) - 1e-12
+    if n <= EXACT_MAX_N:
+        perms = np.array(list(itertools.permutations(range(n))))
+        p = float(np.mean(np.abs(corr(a[perms])) >= threshold))
+        return {"p": p, "permutations": len(perms), "exact": True, "half_width": 0.0}
+
+    size = max(1, min(max_permutations, PERMUTATION_CELLS // n))
+    workers = os.cpu_count() or 1
+
+    def run(job):
+        rng = np.random.default_rng([seed, job])
+        batch = rng.permuted(np.broadcast_to(a, (size, n)), axis=1)
+        return int((np.abs(corr(batch)) >= threshold).sum())
+
+    hits = done = job = 0
+    while done < max_permutations:
+        jobs = range(job, job + workers)
+        hits += sum(get_worker_pool().map(run, jobs))
+        job += workers
+        done += workers * size
+        p = (hits + 1) / (done + 1)
+        half_width = 1.96 * np.sqrt(p * (1 - p) / done)
+        if half_width <= precision:
+            break
+    return {"p": p, "permutations": done, "exact": False, "half_width": float(half_width)}
 
 if uploaded_file:
-    df = read_data(uploaded_file)
+    # Cached frame is shared: never mutate it in place (copy before editing).
+    digest = file_digest(uploaded_file)
+    source = uploaded_file
+    sheet = 0
+    if uploaded_file.name.lower().endswith(".xlsx"):
+        sheets = excel_sheets(uploaded_file)
+        sheet = st.selectbox(T["sheet"], sheets) if len(sheets) > 1 else sheets[0]
+        if excel_to_parquet:
+            source = sheet_as_parquet(uploaded_file, sheet)
+
+    streaming = stream_mode and source.name.lower().endswith(".csv")
+    columnar = is_columnar(source)
+    # Projected sources hold only a preview sample; columns are read on demand.
+    projected = streaming or columnar
+    if columnar:
+        source_key = ("columnar_head", file_digest(source), SNIFF_ROWS)
+        raw_df = columnar_preview(source)
+    elif streaming:
+        source_key = ("sniff", digest, 0, SNIFF_ROWS)
+        raw_df = sniff_data(source)
+    else:
+        source_key = ("frame", digest, csv_engine, sheet)
+        raw_df, job = parse_in_background(source, csv_engine, sheet)
+        if job is not None:
+            # Phase 1: preview and column list from the sniff while the full
+            # parse runs; the rerun at the end fills in the analysis sections.
+            head = sniff_data(source, sheet)
+            st.subheader(T["preview"])
+            st.dataframe(head.head())
+            with st.expander(f"{T['columns']} ({len(head.columns)})"):
+                st.write(", ".join(map(str, head.columns)))
+            # Updating an element each tick keeps the page responsive to reruns.
+            status = st.empty()
+            started = time.time()
+            while not job.done():
+                progress = job.progress()
+                if progress is None:
+                    status.info(f"⏳ {T['parsing']} ({time.time() - started:.0f}s)")
+                else:
+                    status.progress(progress, text=T["parsing"])
+                time.sleep(0.25)
+            st.rerun()
+
+    # Per-session conversion plan (sorted tuple of column names), per file/sheet.
+    plans = st.session_state.setdefault("conversion_plans", {})
+    plan = plans.get((digest, sheet), ())
+    df = apply_conversions(raw_df, source_key, plan)
 
     st.subheader(T["preview"])
     st.dataframe(df.head())
+    if "parsed_bytes" in raw_df.attrs:
+        st.caption(
+            f"{T['memory']}: {format_bytes(raw_df.attrs['parsed_bytes'])} → {format_bytes(nbytes(raw_df))}"
+        )
 
     # --- Optional conversion tool (helps when numeric columns are read as text) ---
     st.caption(T["convert_hint"])
-    convert_candidates = [c for c in df.columns if df[c].dtype == "object"]
+    if plan:
+        st.caption(f"{T['converted']}: {', '.join(map(str, plan))}")
+    convert_candidates = [c for c in df.columns if is_text_column(df[c])]
     if convert_candidates:
         cols_to_convert = st.multiselect(T["convert_cols"], options=convert_candidates)
         if st.button(T["apply_convert"]):
-            for c in cols_to_convert:
-                df[c] = pd.to_numeric(df[c], errors="coerce")
+            plan = tuple(sorted(set(plan) | set(cols_to_convert), key=str))
+            plans[(digest, sheet)] = plan
+            df = apply_conversions(raw_df, source_key, plan)
             st.success("Conversion applied." if lang == "en" else "Konversi diterapkan.")
             st.dataframe(df.head())
 
+    # --- Append wave: new responses merged into the cached dataset ---
+    wave_files = st.file_uploader(
+        T["append_wave"], type=UPLOAD_TYPES, accept_multiple_files=True, help=T["append_wave_help"]
+    )
+    waves = []
+    for w in wave_files or []:
+        wave_df = load_data(w, csv_engine)
+        # Plan columns the wave lacks are left empty below, not converted.
+        wave_plan = tuple(c for c in plan if c in wave_df.columns)
+        wave_df = apply_conversions(wave_df, ("frame", file_digest(w), csv_engine, 0), wave_plan)
+        missing = [c for c in df.columns if c not in wave_df.columns]
+        if missing:
+            st.warning(f"{w.name}: {T['wave_missing']}: {', '.join(map(str, missing))}")
+        waves.append(wave_df.reindex(columns=df.columns))
+    wave_ids = tuple(file_digest(w) for w in wave_files or [])
+    if waves and not projected:
+        cache = get_cache()
+        key = ("appended", source_key, plan, wave_ids)
+        appended = cache.get(key)
+        if appended is None:
+            appended = cache.put(key, pd.concat([df, *waves], ignore_index=True))
+        df = appended
+    if waves:
+        st.caption(T["wave_rows"].format(waves=len(waves), rows=sum(len(w) for w in waves)))
+
     # Detect numeric columns after conversion attempt
     numeric_cols = df.select_dtypes(include=np.number).columns.tolist()
 
@@ -142,6 +2059,10 @@ if uploaded_file:
         st.warning(T["warn_no_numeric"])
         st.stop()
 
+    weight_col = st.selectbox(
+        T["weight_col"], [None] + numeric_cols, format_func=lambda c: T["no_weight"] if c is None else str(c)
+    )
+
     # =====================
     # Descriptive Analysis
     # =====================
@@ -153,57 +2074,359 @@ if uploaded_file:
         default=numeric_cols[: min(10, len(numeric_cols))]
     )
 
+    def get_columns(cols):
+        """Selected columns from whichever source is active (full frame or projected)."""
+        cols = list(dict.fromkeys(cols))
+        if projected:
+            frame = read_columns(source, cols, plan)
+            if waves:
+                frame = pd.concat([frame, *[w[cols] for w in waves]], ignore_index=True)
+            return frame
+        return df[cols]
+
+    # Identifies the analysed data (file, sheet, conversions, appended waves) in
+    # result caches; previous_key is the same data before the last wave.
+    data_key = (digest, sheet, plan, wave_ids)
+    previous_key = (digest, sheet, plan, wave_ids[:-1]) if wave_ids else None
+
+    # Grouping candidates: text columns and low-cardinality numeric columns.
+    # Cardinality scan once per dataset, not on every rerun. Projected sources
+    # only have the preview here, so split_labels() re-checks the full column.
+    cache = get_cache()
+    split_options = cache.get(("split_options", data_key))
+    if split_options is None:
+        split_options = cache.put(
+            ("split_options", data_key),
+            [c for c in df.columns if is_text_column(df[c]) or df[c].nunique() <= MAX_GROUPS],
+        )
+
+    def get_labels(col):
+        """A grouping column as labels; numeric coercion of projected CSVs is skipped."""
+        if not streaming:
+            return get_columns([col])[col].reset_index(drop=True)
+        labels = stream_labels(source, col)
+        if waves:
+            labels = pd.concat([labels.astype(object), *[w[col].astype(object) for w in waves]], ignore_index=True)
+        return labels
+
+    def split_labels(col):
+        """get_labels() for a split column; None (with a warning) when a projected
+        numeric column has more than MAX_GROUPS values beyond its preview."""
+        labels = get_labels(col)
+        if projected and not is_text_column(df[col]) and labels.nunique() > MAX_GROUPS:
+            st.warning(T["too_many_groups"].format(col=col, limit=MAX_GROUPS))
+            return None
+        return labels
+
+    def get_weights():
+        """Survey weights as float64 (NaN where missing)."""
+        return get_columns([weight_col])[weight_col].to_numpy(np.float64, na_value=np.nan)
+
+    screen_normality = st.checkbox(T["normality_screen"], value=True)
+    if weight_col:
+        desc_engine = "weighted"
+    elif streaming:
+        desc_engine = "streaming"
+    else:
+        desc_engine = st.radio(
+            T["desc_engine"],
+            ["exact", "parallel", "moments"],
+            format_func=lambda x: T[f"desc_engine_{x}"],
+            horizontal=True,
+        )
+    sketch_k = None
+    if desc_engine in ("streaming", "moments"):
+        if st.checkbox(T["sketch"], help=T["sketch_help"]):
+            accuracy = st.select_slider(T["sketch_accuracy"], options=[0.5, 1.0, 2.0, 5.0], value=1.0)
+            sketch_k = int(np.ceil(2.0 / (accuracy / 100)))
+
     if desc_cols:
-        st.dataframe(df[desc_cols].describe().T.round(4))
+        if weight_col:
+            cache = get_cache()
+            key = ("weighted_describe", data_key, weight_col, tuple(desc_cols))
+            table = cache.get(key)
+            if table is None:
+                x = numeric_matrix(get_columns(desc_cols)[desc_cols])
+                table = cache.put(key, weighted_describe(x, get_weights(), desc_cols))
+            table = table.copy()
+        elif streaming:
+            summary = stream_summary(source, numeric_cols, sketch_k)
+            if waves:
+                # The streamed base is folded once; only the waves are summarised.
+                wave_rows = pd.concat([w.reindex(columns=numeric_cols) for w in waves], ignore_index=True)
+                delta = frame_summary(wave_rows, ("summary", data_key, "waves", tuple(numeric_cols)), sketch_k)
+                summary = merge_summaries(summary, delta)
+            table = summary_table(summary, numeric_cols).loc[desc_cols]
+        elif desc_engine == "parallel":
+            cache = get_cache()
+            key = ("describe", data_key, tuple(desc_cols))
+            table = cache.get(key)
+            if table is None:
+                table = cache.put(key, parallel_describe(get_columns(desc_cols)))
+            table = table.copy()
+        elif desc_engine == "moments":
+            summary = frame_summary(
+                get_columns(desc_cols),
+                ("summary", data_key, tuple(desc_cols)),
+                sketch_k,
+                previous=("summary", previous_key, tuple(desc_cols)) if previous_key else None,
+            )
+            table = summary_table(summary, desc_cols)
+        else:
+            table = get_columns(desc_cols).describe().T
+        if screen_normality and streaming and not weight_col:
+            # Same test per column as normality_test(): K² straight from the
+            # streamed moments where the mode asks for it, otherwise the values.
+            screen = streamed_normality(summary["moments"], numeric_cols, data_key, normality_mode)
+            rest = [c for c in desc_cols if c not in screen.index]
+            if rest:
+                screen = pd.concat([screen, normality_screen(get_columns(rest), data_key, mode=normality_mode)])
+        elif screen_normality:
+            # Only the selected columns (projected sources read nothing more);
+            # cached per column for the pair rule.
+            screen = normality_screen(get_columns(desc_cols), data_key, mode=normality_mode)
+        if screen_normality:
+            table[T["normal_p"]] = screen.loc[desc_cols, "p"]
+            table[T["normal_test"]] = screen.loc[desc_cols, "test"] + " (n=" + screen.loc[desc_cols, "n"].astype(str) + ")"
+        st.dataframe(table.round(4))
+        if weight_col:
+            st.caption(T["weighted_note"].format(col=weight_col))
+        elif streaming:
+            st.caption(T["stream_note"])
+        if sketch_k:
+            st.caption(T["sketch_note"].format(accuracy=accuracy))
+
+        # --- Split by: the same table per segment, one groupby pass, cached ---
+        split_col = st.selectbox(
+            T["split_by"], [None] + split_options, format_func=lambda c: T["no_split"] if c is None else str(c)
+        )
+        if split_col is not None:
+            cache = get_cache()
+            key = ("grouped", data_key, split_col, weight_col, tuple(desc_cols))
+            grouped = cache.get(key)
+            labels = split_labels(split_col) if grouped is None else None
+            if labels is not None:
+                frame = get_columns(desc_cols)[desc_cols].reset_index(drop=True)
+                if weight_col:
+                    grouped = grouped_weighted_describe(numeric_matrix(frame), get_weights(), labels, desc_cols)
+                else:
+                    grouped = grouped_describe(frame, labels)
+                grouped = cache.put(key, grouped)
+            if grouped is not None:
+                segments = list(grouped.index.get_level_values(0).unique())
+                segment = st.selectbox(
+                    T["segment"], [None] + segments, format_func=lambda g: T["all_segments"] if g is None else str(g)
+                )
+                st.dataframe((grouped if segment is None else grouped.loc[segment]).round(4))
 
     # =====================
     # Association Analysis
     # =====================
+    assoc_mode = st.radio(
+        T["assoc_mode"],
+        ["pair", "matrix", "topk"],
+        format_func=lambda x: T[f"mode_{x}"],
+        horizontal=True,
+    )
+    if weight_col and assoc_mode != "pair":
+        st.caption(T["weights_pair_only"])
+
+    def correction_controls():
+        """Multiple-testing correction and q threshold for batch results."""
+        c1, c2 = st.columns(2)
+        correction = c1.radio(
+            T["correction"], ["bh", "holm"], format_func=lambda c: T[f"correction_{c}"], horizontal=True
+        )
+        q_max = c2.number_input(T["q_threshold"], min_value=0.0, max_value=1.0, value=1.0, step=0.01)
+        return correction, q_max
+
+    def correlation_source(cols):
+        """Correlation results covering `cols`: the matrix-mode result when its
+        columns include them, else computed (and cached) for `cols` alone."""
+        cache = get_cache()
+        shown = st.session_state.get("matrix_cols")
+        if shown and set(cols) <= set(shown):
+            result = cache.get(("matrix", data_key, tuple(shown)))
+            if result is not None:
+                return result, list(shown)
+        key = ("matrix", data_key, tuple(cols))
+        result = cache.get(key)
+        if result is None:
+            result = cache.put(key, correlation_matrices(numeric_matrix(get_columns(cols)[cols])))
+        return result, list(cols)
+
+    if assoc_mode == "matrix":
+        st.subheader(T["mode_matrix"])
+        matrix_cols = st.multiselect(T["matrix_cols"], options=numeric_cols, default=numeric_cols)
+        with_kendall = st.checkbox(T["include_kendall"])
+        matrix_covariates = st.multiselect(T["covariates"], options=numeric_cols, key="matrix_covariates")
+        if st.button(T["run_matrix"]):
+            st.session_state["matrix_cols"] = tuple(matrix_cols)
+
+        # Results stay on screen (served from cache) until the selection changes.
+        if len(matrix_cols) >= 2 and st.session_state.get("matrix_cols") == tuple(matrix_cols):
+            cache = get_cache()
+            key = ("matrix", data_key, tuple(matrix_cols))
+            result = cache.get(key)
+            if result is None:
+                x = numeric_matrix(get_columns(matrix_cols)[matrix_cols])
+                previous = cache.get(("matrix", previous_key, tuple(matrix_cols))) if previous_key else None
+                result = cache.put(key, correlation_matrices(x, previous))
+            kendall = None
+            if with_kendall:
+                kendall = cache.get(("kendall", data_key, tuple(matrix_cols)))
+                if kendall is None:
+                    x = numeric_matrix(get_columns(matrix_cols)[matrix_cols])
+                    kendall = cache.put(("kendall", data_key, tuple(matrix_cols)), kendall_matrix(x))
+            # Adjusted p-values are computed once per batch and cached with the table.
+            key = ("matrix_table", data_key, tuple(matrix_cols), with_kendall)
+            table = cache.get(key)
+            if table is None:
+                table = pairs_table(matrix_cols, result, kendall)
+                table = cache.put(key, add_adjusted(table, [c for c in table.columns if c.endswith(" p")]))
+            correction, q_max = correction_controls()
+            st.caption(T["pairwise_note"])
+            st.dataframe(filter_adjusted(table, correction, q_max).round(4), hide_index=True)
+
+            targets = [c for c in matrix_cols if c not in matrix_covariates]
+            if matrix_covariates and len(targets) >= 2:
+                key = ("partial_table", data_key, tuple(matrix_cols), tuple(matrix_covariates))
+                partial_table = cache.get(key)
+                if partial_table is None:
+                    if set(matrix_covariates) <= set(matrix_cols):
+                        corr_result, corr_cols = result, list(matrix_cols)
+                    else:
+                        corr_result, corr_cols = correlation_source(targets + list(matrix_covariates))
+                    partial = partial_correlations(corr_result, corr_cols, targets, matrix_covariates)
+                    partial_table = pairs_table(targets, partial)
+                    partial_table = cache.put(
+                        key, add_adjusted(partial_table, [c for c in partial_table.columns if c.endswith(" p")])
+                    )
+                st.subheader(f"{T['partial']}: {', '.join(map(str, matrix_covariates))}")
+                st.dataframe(filter_adjusted(partial_table, correction, q_max).round(4), hide_index=True)
+
+            heat_method = st.radio(
+                T["method"], ["Pearson", "Spearman"] + (["Kendall tau-b"] if with_kendall else []), horizontal=True
+            )
+            r = {"Pearson": result["pearson"], "Spearman": result["spearman"]}.get(heat_method)
+            if r is None:
+                r = kendall["tau"]
+            st.pyplot(plot_heatmap(r, matrix_cols, f"{heat_method} — {T['heatmap']}"))
+        elif len(matrix_cols) < 2:
+            st.warning(T["error_matrix"])
+        st.stop()
+
+    if assoc_mode == "topk":
+        st.subheader(T["mode_topk"])
+        topk_cols = st.multiselect(T["matrix_cols"], options=numeric_cols, default=numeric_cols, key="topk_cols")
+        top_k = int(st.number_input(T["top_k"], min_value=1, max_value=1000, value=20, step=1))
+        if st.button(T["run_topk"]):
+            st.session_state["topk_run"] = (tuple(topk_cols), top_k)
+
+        if len(topk_cols) < 2:
+            st.warning(T["error_matrix"])
+        elif st.session_state.get("topk_run") == (tuple(topk_cols), top_k):
+            cache = get_cache()
+            key = ("topk", data_key, tuple(topk_cols), top_k)
+            table = cache.get(key)
+            if table is None:
+                frame = get_columns(topk_cols)[topk_cols]
+                normal_p = normality_screen(frame, data_key, mode=normality_mode)["p"].to_numpy()
+                found = top_k_associations(numeric_matrix(frame), top_k, normal_p)
+                table = pd.DataFrame(
+                    [(topk_cols[i], topk_cols[j], n, m, r, p) for i, j, n, m, r, p in found],
+                    columns=["X", "Y", "n", "method", "r", "p"],
+                )
+                # Family size: every pair that was screened, not just the k shown.
+                n_tests = len(topk_cols) * (len(topk_cols) - 1) // 2
+                table = cache.put(key, add_adjusted(table, ["p"], n_tests))
+            correction, q_max = correction_controls()
+            st.caption(T["topk_note"])
+            st.caption(T["topk_adjust_note"])
+            shown = filter_adjusted(table, correction, q_max)
+            shown = shown.rename(columns={
+                "method": T["method"],
+                "r": T["corr"],
+                "p": T["pval"],
+                "p (BH q)": f"{T['pval']} (BH q)",
+                "p (Holm)": f"{T['pval']} (Holm)",
+            })
+            st.dataframe(shown.round(4), hide_index=True)
+        st.stop()
+
     st.subheader(T["select_x"])
     col_x = st.selectbox(T["select_x"], numeric_cols, index=0)
     col_y = st.selectbox(T["select_y"], numeric_cols, index=1 if len(numeric_cols) > 1 else 0)
+    pair_method = st.radio(
+        T["method"],
+        ["auto", "Pearson", "Spearman", "Kendall"],
+        format_func=lambda m: {"auto": T["method_auto"], "Kendall": "Kendall tau-b"}.get(m, m),
+        horizontal=True,
+    )
+    group_col = st.selectbox(
+        T["group_corr_by"], [None] + split_options, format_func=lambda c: T["no_split"] if c is None else str(c)
+    )
+    permutation = st.checkbox(T["permutation"], help=T["permutation_help"])
+    if permutation:
+        precision = st.select_slider(T["perm_precision"], options=[0.01, 0.005, 0.002, 0.001], value=0.005)
+    covariates = st.multiselect(
+        T["covariates"], options=[c for c in numeric_cols if c not in (col_x, col_y)], key="pair_covariates"
+    )
+    bootstrap = st.checkbox(T["bootstrap"], help=T["bootstrap_help"])
+    if bootstrap:
+        resamples = int(st.number_input(T["resamples"], min_value=1000, max_value=100_000, value=10_000, step=1000))
 
     if st.button(T["analyze"]):
-        data = df[[col_x, col_y]].copy()
-        data[col_x] = pd.to_numeric(data[col_x], errors="coerce")
-        data[col_y] = pd.to_numeric(data[col_y], errors="coerce")
-        data = data.dropna()
+        # Columns are already numeric (dtype-detected or converted via the plan).
+        pair = get_columns([col_x, col_y])
+        rows = pair.notna().all(axis=1).to_numpy()
+        if weight_col:
+            weights = get_weights()
+            rows = rows & valid_weights(weights)
+        # Stored columns may be downcast (int8/float32); analyse in float64.
+        data = pair.loc[rows, [col_x, col_y]].astype(np.float64)
 
         if len(data) < 3:
             st.error(T["error_pairs"])
             st.stop()
 
         # -------- Normality test (safe) --------
-        # Shapiro can fail if data are constant; handle with try/except.
-        def safe_shapiro(x):
-            x = np.asarray(x)
-            if len(x) < 3:
-                return np.nan
-            if np.all(x == x[0]):  # constant
-                return np.nan
-            try:
-                _, p = shapiro(x)
-                return float(p)
-            except Exception:
-                return np.nan
-
-        p_x = safe_shapiro(data[col_x])
-        p_y = safe_shapiro(data[col_y])
+        # Cached per column and row subset: repeat runs (and pairs with no extra
+        # missing rows, already covered by the screen) are a lookup.
+        screen = normality_screen(pair, data_key, rows=rows, mode=normality_mode)
+        p_x, p_y = screen.loc[col_x, "p"], screen.loc[col_y, "p"]
 
         st.subheader(T["normality"])
         st.write(f"{T['px']}: {('N/A' if np.isnan(p_x) else f'{p_x:.4f}')}")
         st.write(f"{T['py']}: {('N/A' if np.isnan(p_y) else f'{p_y:.4f}')}")
+        st.caption(f"{T['normal_test']}: {screen.loc[col_x, 'test']} (n = {screen.loc[col_x, 'n']})")
 
-        # Rule:
+        # Rule (automatic choice):
         # If both p-values available and > 0.05 -> Pearson; otherwise Spearman
-        use_pearson = (not np.isnan(p_x)) and (not np.isnan(p_y)) and (p_x > 0.05) and (p_y > 0.05)
+        if pair_method == "auto":
+            base_method = "Pearson" if use_pearson_rule(p_x, p_y) else "Spearman"
+        else:
+            base_method = pair_method
+        use_pearson = base_method == "Pearson"
 
-        if use_pearson:
+        if base_method == "Kendall":
+            method = "Kendall tau-b"
+            cache = get_cache()
+            key = ("kendall_pair", data_key, col_x, col_y, weight_col)
+            result = cache.get(key)
+            if result is None:
+                result = cache.put(key, kendall_pair(data[col_x].to_numpy(), data[col_y].to_numpy()))
+            corr, pval = result
+        elif weight_col:
+            x_w, y_w, w = data[col_x].to_numpy(), data[col_y].to_numpy(), weights[rows]
+            method = f"{'Pearson' if use_pearson else 'Spearman'} ({T['weighted']})"
+            corr, pval = weighted_pearson(x_w, y_w, w) if use_pearson else weighted_spearman(x_w, y_w, w)
+        elif use_pearson:
             method = "Pearson"
             corr, pval = pearsonr(data[col_x], data[col_y])
         else:
             method = "Spearman"
-            corr, pval = spearmanr(data[col_x], data[col_y])
+            corr, pval = spearman_cached(pair, col_x, col_y, data_key, rows)
 
         direction = T["positive"] if corr > 0 else T["negative"]
 
@@ -227,6 +2450,79 @@ if uploaded_file:
         c2.metric(T["corr"], f"{corr:.4f}")
         c3.metric(T["pval"], f"{pval:.4f}")
 
+        if covariates:
+            # From the pairwise-complete correlation matrix (matrix-mode cache if
+            # it covers these columns); Kendall and weighted runs use Spearman.
+            partial_method = "pearson" if use_pearson else "spearman"
+            corr_result, corr_cols = correlation_source([col_x, col_y, *covariates])
+            partial = partial_correlations(corr_result, corr_cols, [col_x, col_y], covariates)
+            p1, p2 = st.columns(2)
+            p1.metric(f"{T['partial']} ({partial_method.title()})", f"{partial[partial_method][0, 1]:.4f}")
+            p2.metric(T["pval"], f"{partial[f'{partial_method}_p'][0, 1]:.4f}")
+            st.caption(T["partial_note"].format(covariates=", ".join(map(str, covariates))))
+
+        if base_method == "Kendall" and (weight_col or permutation or bootstrap or group_col is not None):
+            st.caption(T["kendall_note"])
+
+        if permutation and base_method != "Kendall":
+            cache = get_cache()
+            key = ("permutation", data_key, col_x, col_y, weight_col, base_method, precision)
+            test = cache.get(key)
+            if test is None:
+                x_p, y_p = data[col_x].to_numpy(), data[col_y].to_numpy()
+                w = weights[rows] if weight_col else None
+                if base_method == "Spearman" and w is not None:
+                    x_p, y_p = weighted_ranks(x_p, w), weighted_ranks(y_p, w)
+                elif base_method == "Spearman":
+                    x_p, y_p = (cached_ranks(pair, c, data_key, rows)["ranks"] for c in (col_x, col_y))
+                test = cache.put(key, permutation_pvalue(x_p, y_p, w, precision))
+            st.metric(T["perm_p"], f"{test['p']:.4f}")
+            if test["exact"]:
+                st.caption(T["perm_exact"].format(permutations=test["permutations"]))
+            else:
+                st.caption(T["perm_note"].format(permutations=test["permutations"], half_width=test["half_width"]))
+
+        if bootstrap and base_method != "Kendall":
+            cache = get_cache()
+            key = ("bootstrap", data_key, col_x, col_y, weight_col, base_method, resamples)
+            ci = cache.get(key)
+            if ci is None:
+                ranks = None
+                if base_method == "Spearman":
+                    # Only the order and ties matter: the cached ranks of the pair rows.
+                    ranks = tuple(cached_ranks(pair, c, data_key, rows)["ranks"] for c in (col_x, col_y))
+                ci = cache.put(key, bootstrap_corr(
+                    data[col_x].to_numpy(),
+                    data[col_y].to_numpy(),
+                    base_method,
+                    weights[rows] if weight_col else None,
+                    ranks,
+                    resamples,
+                ))
+            st.metric(T["ci"], f"[{ci[0]:.4f}, {ci[1]:.4f}]")
+            st.caption(T["ci_note"].format(resamples=resamples))
+
+        if group_col is not None and base_method != "Kendall":
+            # Same method within every segment, from one sort / bincount pass.
+            cache = get_cache()
+            key = ("group_corr", data_key, col_x, col_y, group_col, weight_col, method)
+            per_group = cache.get(key)
+            labels = split_labels(group_col) if per_group is None else None
+            if labels is not None:
+                per_group = cache.put(key, grouped_correlation(
+                    data[col_x].to_numpy(),
+                    data[col_y].to_numpy(),
+                    labels.to_numpy()[rows],
+                    weights[rows] if weight_col else None,
+                    base_method,
+                ))
+            if per_group is not None:
+                st.subheader(f"{T['group_corr']}: {group_col}")
+                st.dataframe(
+                    per_group.rename(columns={"r": T["corr"], "p": T["pval"]}).round(4),
+                    column_config={"_index": group_col},
+                )
+
         # =====================
         # Visualization (stable regression line)
         # =====================